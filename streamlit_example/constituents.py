@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# S&P 500 CONSTITUENTS
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import os
+import threading
+import time
+from pathlib import Path
+import pandas as pd
+from price_store import CACHE_DIR, temporary_path
+
+# Source of the up-to-date list of constituents
+WIKIPEDIA_URL = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+# Snapshot shipped with the dashboard, used until (or when) Wikipedia is not reachable;
+# it has no GICS Sub-Industry column, left empty until a refreshed copy is downloaded
+SNAPSHOT_PATH = Path(__file__).parent / "data" / "sp500_constituents.csv"
+# Columns kept for every constituent
+CONSTITUENT_COLUMNS = ["Symbol", "Security", "GICS Sector", "GICS Sub-Industry"]
+# Minimum time between two refreshes of the list, in seconds
+REFRESH_INTERVAL = 24 * 60 * 60
+
+#==============================================================================
+# Constituents
+#==============================================================================
+
+def download_constituents():
+    """
+    This function downloads the current list of constituents from Wikipedia.
+    """
+    table = pd.read_html(WIKIPEDIA_URL)[0]
+    return table[CONSTITUENT_COLUMNS].sort_values("Symbol").reset_index(drop=True)
+
+
+def save_snapshot(path=SNAPSHOT_PATH):
+    """
+    This function regenerates the bundled snapshot from the current Wikipedia
+    table, to be run by hand before a release instead of editing the file.
+    """
+    download_constituents().to_csv(path, index=False)
+
+
+class Constituents:
+    """
+    This class serves the list of S&P 500 constituents without any network
+    call on the page load.
+
+    The list is read from the refreshed copy in the cache directory if there
+    is one, else from the bundled snapshot. When the copy is older than
+    refresh_interval, a background thread downloads a new one; if Wikipedia
+    cannot be reached the current list is simply kept.
+    """
+
+    def __init__(self, path=CACHE_DIR / "sp500_constituents.csv", snapshot=SNAPSHOT_PATH,
+                 refresh_interval=REFRESH_INTERVAL, fetch=download_constituents):
+        self.path = Path(path)
+        self.snapshot = Path(snapshot)
+        self.refresh_interval = refresh_interval
+        self.fetch = fetch
+        self._table = None
+        self._last_attempt = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        This function returns the constituents as a DataFrame with the
+        CONSTITUENT_COLUMNS, scheduling a refresh if the list is outdated.
+        """
+        with self._lock:
+            if self._table is None:
+                self._table = self._read()
+            if self._outdated() and not self._refreshing:
+                self._refreshing = True
+                self._last_attempt = time.time()
+                threading.Thread(target=self._refresh, name="constituents", daemon=True).start()
+            return self._table
+
+    def symbols(self):
+        """
+        This function returns the ticker symbols of the constituents.
+        """
+        return self.get()["Symbol"]
+
+    def _read(self):
+        """
+        This function reads the refreshed copy, falling back to the snapshot.
+        Missing columns are left empty.
+        """
+        for path in (self.path, self.snapshot):
+            try:
+                table = pd.read_csv(path, keep_default_na=False)
+                return table.reindex(columns=CONSTITUENT_COLUMNS, fill_value="")
+            except (OSError, ValueError):
+                continue
+        return pd.DataFrame(columns=CONSTITUENT_COLUMNS)
+
+    def _outdated(self):
+        """
+        This function tells if the refreshed copy is missing or older than the
+        refresh interval. Failed attempts also wait for the refresh interval.
+        """
+        try:
+            modified = os.path.getmtime(self.path)
+        except OSError:
+            modified = 0.0
+        return time.time() - max(modified, self._last_attempt) > self.refresh_interval
+
+    def _refresh(self):
+        """
+        This function downloads and saves a new list, runs in a thread.
+        """
+        try:
+            table = self.fetch()
+            if table.empty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            table.to_csv(temporary_path(self.path), index=False)
+            os.replace(temporary_path(self.path), self.path)
+            with self._lock:
+                self._table = table
+        except Exception:
+            pass  # Offline or page changed: keep serving the current list
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+# List shared by all the sessions of the dashboard
+constituents = Constituents()
+
+###############################################################################
+# END
+###############################################################################
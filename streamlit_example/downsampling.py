@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# CHART DOWNSAMPLING
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import numpy as np
+import pandas as pd
+from market_data import OHLCV_AGGREGATION
+
+# Points drawn per trace, about the pixel width of a full-width chart: more
+# points than pixels are not visible but still make the figure heavier
+MAX_POINTS_PER_TRACE = 1500
+
+#==============================================================================
+# OHLC buckets
+#==============================================================================
+
+def ohlc_buckets(bars, max_points=MAX_POINTS_PER_TRACE):
+    """
+    This function merges consecutive bars into at most max_points buckets of
+    equal size: first open, highest high, lowest low, last close and summed
+    volume, so every candle still spans the full range of its bars. Buckets
+    are labelled with the date of their first bar.
+    """
+    n = len(bars)
+    if n <= max_points:
+        return bars
+    size = -(-n // max_points)
+    starts = np.arange(0, n, size)
+    ends = np.minimum(starts + size, n) - 1
+
+    buckets = {}
+    for column, how in OHLCV_AGGREGATION.items():
+        if column not in bars:
+            continue
+        values = bars[column].to_numpy(dtype=float)
+        if how == "first":
+            buckets[column] = values[starts]
+        elif how == "last":
+            buckets[column] = values[ends]
+        elif how == "max":
+            buckets[column] = np.fmax.reduceat(values, starts)
+        elif how == "min":
+            buckets[column] = np.fmin.reduceat(values, starts)
+        else:
+            buckets[column] = np.add.reduceat(np.nan_to_num(values), starts)
+    return pd.DataFrame(buckets, index=bars.index[starts])
+
+#==============================================================================
+# Largest-Triangle-Three-Buckets
+#==============================================================================
+
+def lttb_indices(x, y, threshold):
+    """
+    This function returns the positions of the threshold points kept by the
+    Largest-Triangle-Three-Buckets algorithm (Steinarsson, 2013): the first
+    and last points, plus in every bucket the point forming the largest
+    triangle with the previously kept point and the average of the next
+    bucket. Peaks and troughs are kept, unlike with a plain decimation.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def downsample_line(series, max_points=MAX_POINTS_PER_TRACE):
+    """
+    This function keeps at most max_points points of a date-indexed series
+    with LTTB, missing values (e.g. the start of a moving average) are
+    dropped first.
+    """
+    series = series.dropna()
+    if len(series) <= max_points:
+        return series
+    x = series.index.asi8.astype(float)
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=float), max_points)]
+
+###############################################################################
+# END
+###############################################################################
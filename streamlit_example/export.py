@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# ON-DEMAND PRICE EXPORTS
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import hashlib
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+from price_store import CACHE_DIR, PRICE_COLUMNS, price_store, temporary_path
+
+# File formats offered for the exports: file extension and MIME type
+EXPORT_FORMATS = {"CSV": (".csv", "text/csv"),
+                  "Parquet": (".parquet", "application/vnd.apache.parquet"),
+                  "Feather": (".feather", "application/vnd.apache.arrow.file")}
+# Number of rows written at a time
+CHUNK_ROWS = 50000
+# Directory where the export files are written
+EXPORT_DIR = CACHE_DIR / "exports"
+# Time after which an export file is removed, in seconds
+MAX_AGE = 24 * 60 * 60
+
+#==============================================================================
+# Export
+#==============================================================================
+
+def export_chunks(tickers, start, end, chunk_rows=CHUNK_ROWS):
+    """
+    This function yields the daily bars of the tickers between start and
+    end from the price store, in chunks of at most chunk_rows rows with a
+    'Ticker' column, one ticker after the other.
+    """
+    for ticker in tickers:
+        bars = price_store.get_history(ticker, start, end).reset_index()
+        bars.insert(0, 'Ticker', ticker)
+        for first in range(0, len(bars), chunk_rows):
+            yield bars.iloc[first:first + chunk_rows]
+
+
+def write_csv(chunks, path):
+    """
+    This function appends the chunks to a CSV file, returns False if there
+    were none.
+    """
+    written = False
+    for chunk in chunks:
+        chunk.to_csv(path, mode='a' if written else 'w', header=not written, index=False)
+        written = True
+    return written
+
+
+def write_arrow(chunks, path, open_writer):
+    """
+    This function writes the chunks as the row groups (Parquet) or record
+    batches (Feather) of one file, returns False if there were none.
+    """
+    writer = schema = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = open_writer(path, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return writer is not None
+
+# Function writing the chunks in each of the EXPORT_FORMATS
+WRITERS = {"CSV": write_csv,
+           "Parquet": lambda chunks, path: write_arrow(chunks, path, pq.ParquetWriter),
+           "Feather": lambda chunks, path: write_arrow(chunks, path, pa.ipc.new_file)}
+
+
+def remove_exports(directory, request, keep, max_age=MAX_AGE):
+    """
+    This function removes the export files of a request other than keep
+    (made from older prices) and all the files older than max_age.
+    """
+    for path in directory.glob("*"):
+        try:
+            if (path.name.startswith(request) and path != keep) or \
+                    time.time() - path.stat().st_mtime > max_age:
+                path.unlink()
+        except OSError:
+            pass  # Already removed by another session
+
+
+def export_prices(tickers, start, end, file_format="CSV", directory=EXPORT_DIR):
+    """
+    This function writes the daily bars of the tickers between start and
+    end to a file in one of the EXPORT_FORMATS and returns its path.
+
+    The file is written chunk by chunk, so only one chunk is held in memory,
+    and it is reused as long as the prices of the tickers do not change.
+    The file name is the hash of the request followed by the hash of the
+    price versions, so the copies made from older prices can be removed.
+    The prices are refreshed first, in one batched request, so the versions
+    are the ones the file is written from.
+    """
+    extension, _ = EXPORT_FORMATS[file_format]
+    request = hashlib.sha1(repr((list(tickers), str(start), str(end), file_format)).encode()).hexdigest()
+    price_store.get_histories(tickers, start, end)
+    versions = hashlib.sha1(repr([price_store.version(ticker) for ticker in tickers]).encode()).hexdigest()
+    path = directory / f"{request}_{versions[:16]}{extension}"
+    if path.exists():
+        return path
+
+    directory.mkdir(parents=True, exist_ok=True)
+    remove_exports(directory, request, path)
+    if not WRITERS[file_format](export_chunks(tickers, start, end), temporary_path(path)):
+        # No bars in the range: a file with the columns only
+        empty = pd.DataFrame(columns=['Ticker', 'Date'] + PRICE_COLUMNS)
+        WRITERS[file_format]([empty], temporary_path(path))
+    os.replace(temporary_path(path), path)
+    return path
+
+###############################################################################
+# END
+###############################################################################
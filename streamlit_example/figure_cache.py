@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# SERIALIZED FIGURE CACHE
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import json
+import threading
+from collections import OrderedDict
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# Total size of the serialized figures kept, in bytes
+MAX_BYTES = 64 * 1024**2
+
+#==============================================================================
+# Figure cache
+#==============================================================================
+
+class FigureCache:
+    """
+    This class keeps figures as JSON specs, keyed on everything they are
+    built from (ticker, range, chart type, interval and the price store
+    version), for all the reruns and sessions of the dashboard. The least
+    recently used specs are dropped beyond max_bytes.
+
+    A hit rebuilds the figure from its spec without validation, which is an
+    order of magnitude cheaper than adding and validating the traces again.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._specs = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """
+        This function returns the figure cached for key, calling build() to
+        make it if there is none.
+        """
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self._specs.move_to_end(key)
+
+        if spec is None:
+            spec = pio.to_json(build(), validate=False)
+            with self._lock:
+                if key not in self._specs:
+                    self._specs[key] = spec
+                    self._size += len(spec)
+                while self._size > self.max_bytes and len(self._specs) > 1:
+                    _, dropped = self._specs.popitem(last=False)
+                    self._size -= len(dropped)
+
+        return go.Figure(json.loads(spec), _validate=False)
+
+# Cache shared by all the sessions of the dashboard
+figure_cache = FigureCache()
+
+###############################################################################
+# END
+###############################################################################
@@ -21,65 +21,26 @@ import streamlit as st
 # Ref: https://github.com/ranaroussi/yfinance/issues/1729
 #==============================================================================
 
-import requests
 import urllib
+from constituents import constituents
+from info_cache import info_cache
+from yahoo_session import yahoo_session
 
 class YFinance:
-    user_agent_key = "User-Agent"
-    user_agent_value = ("Mozilla/5.0 (Windows NT 6.1; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/58.0.3029.110 Safari/537.36")
-    
     def __init__(self, ticker):
         self.yahoo_ticker = ticker
 
     def __str__(self):
         return self.yahoo_ticker
 
-    def _get_yahoo_cookie(self):
-        cookie = None
-
-        headers = {self.user_agent_key: self.user_agent_value}
-        response = requests.get("https://fc.yahoo.com",
-                                headers=headers,
-                                allow_redirects=True)
-
-        if not response.cookies:
-            raise Exception("Failed to obtain Yahoo auth cookie.")
-
-        cookie = list(response.cookies)[0]
-
-        return cookie
-
-    def _get_yahoo_crumb(self, cookie):
-        crumb = None
-
-        headers = {self.user_agent_key: self.user_agent_value}
-
-        crumb_response = requests.get(
-            "https://query1.finance.yahoo.com/v1/test/getcrumb",
-            headers=headers,
-            cookies={cookie.name: cookie.value},
-            allow_redirects=True,
-        )
-        crumb = crumb_response.text
-
-        if crumb is None:
-            raise Exception("Failed to retrieve Yahoo crumb.")
-
-        return crumb
-
     @property
     def info(self):
         # Yahoo modules doc informations :
         # https://cryptocointracker.com/yahoo-finance/yahoo-finance-api
-        cookie = self._get_yahoo_cookie()
-        crumb = self._get_yahoo_crumb(cookie)
+        # The cookie, crumb and connections are shared through yahoo_session
         info = {}
         ret = {}
 
-        headers = {self.user_agent_key: self.user_agent_value}
-
         yahoo_modules = ("assetProfile,"  # longBusinessSummary
                          "summaryDetail,"
                          "financialData,"
@@ -87,14 +48,10 @@ class YFinance:
                          "defaultKeyStatistics")
 
         url = ("https://query1.finance.yahoo.com/v10/finance/"
-               f"quoteSummary/{self.yahoo_ticker}"
-               f"?modules={urllib.parse.quote_plus(yahoo_modules)}"
-               f"&ssl=true&crumb={urllib.parse.quote_plus(crumb)}")
+               f"quoteSummary/{urllib.parse.quote(self.yahoo_ticker)}")
 
-        info_response = requests.get(url,
-                                     headers=headers,
-                                     cookies={cookie.name: cookie.value},
-                                     allow_redirects=True)
+        info_response = yahoo_session.get(url, params={"modules": yahoo_modules,
+                                                       "ssl": "true"})
 
         info = info_response.json()
         info = info['quoteSummary']['result'][0]
@@ -111,6 +68,10 @@ class YFinance:
 
         return ret
 
+# Company information served from the cache shared by all the sessions, under a
+# source name of its own; registered on every run of the script, outside the tabs
+info_cache.register_source("yahoo", lambda ticker: YFinance(ticker).info)
+
 #==============================================================================
 # Header
 #==============================================================================
@@ -130,8 +91,8 @@ def render_header():
     col2.image('./img/yahoo_finance.png', width=100)
     
     # Add the ticker selection on the sidebar
-    # Get the list of stock tickers from S&P500
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    # Get the list of stock tickers from S&P500 (bundled snapshot, refreshed daily)
+    ticker_list = constituents.symbols()
     
     # Add the selection boxes
     col1, col2, col3 = st.columns(3)  # Create 3 columns
@@ -157,19 +118,10 @@ def render_tab1():
     col2.image('./img/stock_market.jpg', use_column_width=True,
                caption='Company Stock Information')
     
-    # Get the company information
-    @st.cache_data
-    def GetCompanyInfo(ticker):
-        """
-        This function get the company information from Yahoo Finance.
-        """        
-        return YFinance(ticker).info
-        #return yf.Ticker(ticker).info
-    
     # If the ticker is already selected
     if ticker != '':
         # Get the company information in list format
-        info = GetCompanyInfo(ticker)
+        info = info_cache.get(ticker, source="yahoo")
         
         # Show the company description using markdown + HTML
         st.write('**1. Business Summary:**')
@@ -8,14 +8,32 @@
 #==============================================================================
 
 # Libraries
+import os
+import time
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import yfinance as yf
 import streamlit as st
 from plotly.subplots import make_subplots
+from constituents import constituents
+from downsampling import downsample_line, ohlc_buckets
+from export import EXPORT_FORMATS, export_prices
+from figure_cache import figure_cache
+from montecarlo import (DEFAULT_BATCHES, FAN_PERCENTILES, PortfolioModel, RETURN_MODELS,
+                        batch_standard_errors, fan_bands, simulate_portfolio, simulate_streaming)
+from indicators import INDICATORS, OVERLAYS, TRADING_DAYS, indicator_store
+from info_cache import info_cache
+from market_data import DURATIONS, INTERVALS, duration_start, get_bars, get_watchlist
+from news_feed import POLL_INTERVAL, news_feed
+from prefetch import prefetcher
+from price_pyramid import choose_level, price_pyramid
+from price_store import price_store
+from return_matrix import return_matrix
+from screener import screener
+from simulation_store import BLOCK_SIZE, simulation_store
+from statements_store import STATEMENTS
 
 
 #==============================================================================
@@ -25,45 +43,106 @@ from plotly.subplots import make_subplots
 # Code Provided by Prof. Minh Phan in the coursework
 #==============================================================================
 
+# Upper bound on the number of simulated paths drawn in the Monte Carlo chart
+MAX_PLOTTED_PATHS = 200
+# Number of sample paths drawn on top of the Monte Carlo fan chart
+FAN_SAMPLE_PATHS = 20
+
+# Return models offered in the Monte Carlo tab
+RETURN_MODEL_OPTIONS = {"Geometric Brownian motion": "gbm",
+                        "Historical bootstrap": "bootstrap",
+                        "Student-t": "student_t",
+                        "GARCH(1,1)": "garch"}
+
+# Variance reduction methods offered in the Monte Carlo tab
+VARIANCE_REDUCTION_OPTIONS = {"None": "plain",
+                              "Antithetic variates": "antithetic",
+                              "Moment matching": "moment_matching",
+                              "Sobol (quasi-random)": "sobol"}
+
+# Share of the constituents the return matrix must hold to simulate "All constituents"
+MIN_MATRIX_COVERAGE = 0.9
+
+# Tickers shown by the watchlist until the user picks others
+DEFAULT_WATCHLIST = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "JPM", "XOM"]
+
+
+def session_result(name, key, compute):
+    """
+    This function returns the result stored in the session state under name
+    if it was computed for the same key, else it computes and stores it, so
+    switching back to a section redraws it without fetching or simulating.
+    """
+    stored = st.session_state.get(name)
+    if stored is None or stored[0] != key:
+        stored = (key, compute())
+        st.session_state[name] = stored
+    return stored[1]
+
+
+def format_error(value):
+    """
+    This function formats a standard error in dollars, or "n/a" when it
+    cannot be estimated (a single batch of paths).
+    """
+    return f"${value:.2f}" if np.isfinite(value) else "n/a"
+
+
+def keep_widget_state(active_prefix):
+    """
+    This function keeps the values of the widgets of the sections that are
+    not rendered in this run (Streamlit resets the widgets it does not see).
+    Section widgets have keys starting with their prefix, e.g. "tab2_".
+    """
+    for key in list(st.session_state):
+        if key.startswith("tab") and not key.startswith(active_prefix + "_"):
+            st.session_state[key] = st.session_state[key]
+
 
 def render_sidebar():
     st.sidebar.title("Financial Dashboard")
     st.sidebar.write("Data source:")
     #st.sidebar.image('./img/yahoo_finance.png', width=100)
 
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    ticker_list = constituents.symbols()
 
     global ticker
     ticker = st.sidebar.selectbox("Ticker", ticker_list)
+    # Fetch all the datasets of the ticker concurrently, the tabs wait for their own
+    prefetcher.prefetch(ticker)
+    # Aligned closes and returns of all the constituents, built in the background once a day
+    return_matrix.start()
 
     global start_date, end_date
     start_date = st.sidebar.date_input("Start date", datetime.today().date() - timedelta(days=30))
     end_date = st.sidebar.date_input("End date", datetime.today().date())
 
-    data = yf.download(ticker, start=start_date, end=end_date)
-    df = pd.DataFrame(data)
-
-    csv = df.to_csv(index=True).encode('utf-8')
-    st.sidebar.download_button(
-        label="Download",
-        data=csv,
-        file_name=f'{ticker}_data.csv',
-        mime='text/csv'
-    )
+    # The export file is only written when it is requested, from the price store
+    export_tickers = st.sidebar.multiselect("Export Tickers", ticker_list, default=[ticker])
+    export_format = st.sidebar.selectbox("Export Format", list(EXPORT_FORMATS))
+    export_request = (tuple(export_tickers or [ticker]), start_date, end_date, export_format)
+    if st.sidebar.button("Prepare Download"):
+        # Only offered in the run of the request: the button holds the whole file in
+        # memory, so it is not read again on the following reruns
+        extension, mime = EXPORT_FORMATS[export_format]
+        with open(export_prices(*export_request), 'rb') as export_file:
+            st.sidebar.download_button(
+                label="Download",
+                data=export_file,
+                file_name=f"{'_'.join(export_request[0])}_data{extension}",
+                mime=mime
+            )
 
     if st.sidebar.button("Refresh Data"):
         st.sidebar.success("Data refreshed successfully!")
 
+@st.fragment
 def render_tab1():
     col1, col2, col3 = st.columns([1, 3, 1])
     #col2.image('./img/stock_market.jpg', use_column_width=True, caption='Company Stock Information')
 
-    @st.cache_data
-    def GetCompanyInfo(ticker):
-        return yf.Ticker(ticker).info
-
     if ticker != '':
-        info = GetCompanyInfo(ticker)
+        info = info_cache.get(ticker)
         st.write('**1. Business Summary:**')
         st.markdown('<div style="text-align: justify;">' + info['longBusinessSummary'] + '</div><br>', unsafe_allow_html=True)
         st.write('**2. Key Statistics:**')
@@ -78,119 +157,168 @@ def render_tab1():
         coll1, coll2, coll3 = st.columns(3)
         coll2.dataframe(company_stats)
 
+@st.fragment
 def render_tab2():
     st.write("## Stock Price and Volume Chart")
 
-    interval = st.selectbox("Select Duration", ["1M", "3M", "6M", "YTD", "1Y", "3Y", "5Y", "Max"])
-    chart_type = st.selectbox("Select Chart Type", ["Line", "Candlestick"])
-    time_interval = st.selectbox("Select Time Interval", ["1d", "1mo", "1y"])
-
-    end_date = datetime.today()
-    if interval == "1M":
-        start_date = end_date - timedelta(days=30)
-    elif interval == "3M":
-        start_date = end_date - timedelta(days=90)
-    elif interval == "6M":
-        start_date = end_date - timedelta(days=180)
-    elif interval == "YTD":
-        start_date = datetime(end_date.year, 1, 1)
-    elif interval == "1Y":
-        start_date = end_date - timedelta(days=365)
-    elif interval == "3Y":
-        start_date = end_date - timedelta(days=3 * 365)
-    elif interval == "5Y":
-        start_date = end_date - timedelta(days=5 * 365)
-    else:
-        start_date = "1900-01-01"
+    interval = st.selectbox("Select Duration", list(DURATIONS), key="tab2_duration")
+    chart_type = st.selectbox("Select Chart Type", ["Line", "Candlestick"], key="tab2_chart_type")
+    time_interval = st.selectbox("Select Time Interval", ["Auto"] + list(INTERVALS), key="tab2_interval",
+                                 help="Auto draws daily bars for short windows and weekly, monthly "
+                                      "or quarterly bars for longer ones.")
+    selected_indicators = st.multiselect("Indicators", list(INDICATORS), key="tab2_indicators",
+                                         help="Computed on the daily bars.")
+
+    if ticker and time_interval == "Auto":
+        # Precomputed levels: the coarsest one fitting the chart for the whole
+        # duration, finer ones as the zoom window is narrowed
+        levels = price_pyramid.get_levels(ticker)
+        daily_index = levels["1d"].index
+        stock_data, chart_range = levels["1d"], None
+        if len(daily_index):
+            first = max(duration_start(interval), daily_index[0]).date()
+            last = daily_index[-1].date()
+            window = (first, last)
+            if first < last:
+                # One zoom widget for every ticker and duration, reset when its bounds change
+                if st.session_state.get("zoom_bounds") != (ticker, first, last):
+                    st.session_state["zoom_bounds"] = (ticker, first, last)
+                    st.session_state["tab2_zoom"] = (first, last)
+                window = st.slider("Zoom", first, last, format="YYYY-MM-DD", key="tab2_zoom")
+            level = choose_level(levels, *window)
+            stock_data = levels[level].loc[pd.Timestamp(window[0]):pd.Timestamp(window[1])]
+            # Always a 50-day average, whatever the level of the bars, downsampled like them
+            moving_average = levels["1d"]['Close'].rolling(window=50).mean()
+            moving_average = moving_average.loc[pd.Timestamp(window[0]):pd.Timestamp(window[1])]
+            chart_range = window
+            st.caption(f"Showing {level} bars from {window[0]} to {window[1]}.")
+    elif ticker:
+        # Sliced and resampled locally from the daily history of the ticker
+        stock_data = get_bars(ticker, interval, time_interval)
+        moving_average = stock_data['Close'].rolling(window=50).mean()
+        chart_range = duration_start(interval)
 
     if ticker:
-        stock_data = yf.download(ticker, start=start_date, end=end_date, interval=time_interval)
-
         if not stock_data.empty:
-            stock_data['MA50'] = stock_data['Close'].rolling(window=50).mean()
-            fig = make_subplots(specs=[[{"secondary_y": True}]])
+            def BuildPriceChart():
+                # Long ranges are reduced to about one point per pixel: candles and
+                # volumes are merged into buckets, the lines keep their shape with LTTB
+                buckets = ohlc_buckets(stock_data)
+                close_line = downsample_line(stock_data['Close'])
+                ma_line = downsample_line(moving_average)
+                # Overlays share the price axis, the other indicators get a panel each
+                panels = [name for name in selected_indicators if name not in OVERLAYS]
+                fig = make_subplots(rows=1 + len(panels), cols=1, shared_xaxes=True,
+                                    vertical_spacing=0.04, row_heights=[3] + [1] * len(panels),
+                                    specs=[[{"secondary_y": True}]] + [[{}]] * len(panels))
+
+                if chart_type == "Line":
+                    fig.add_trace(
+                        go.Scatter(
+                            x=close_line.index,
+                            y=close_line,
+                            mode='lines',
+                            name='Stock Price',
+                            line=dict(color='blue')
+                        ),
+                        secondary_y=True, row=1, col=1
+                    )
+                else:
+                    fig.add_trace(
+                        go.Candlestick(
+                            x=buckets.index,
+                            open=buckets['Open'],
+                            high=buckets['High'],
+                            low=buckets['Low'],
+                            close=buckets['Close'],
+                            name='Candlestick'
+                        ),
+                        secondary_y=True, row=1, col=1
+                    )
 
-            if chart_type == "Line":
                 fig.add_trace(
                     go.Scatter(
-                        x=stock_data.index,
-                        y=stock_data['Close'],
+                        x=ma_line.index,
+                        y=ma_line,
                         mode='lines',
-                        name='Stock Price',
-                        line=dict(color='blue')
+                        name='50-day MA',
+                        line=dict(color='orange', width=1.5, dash='dash')
                     ),
-                    secondary_y=True
+                    secondary_y=True, row=1, col=1
                 )
-            else:
+
                 fig.add_trace(
-                    go.Candlestick(
-                        x=stock_data.index,
-                        open=stock_data['Open'],
-                        high=stock_data['High'],
-                        low=stock_data['Low'],
-                        close=stock_data['Close'],
-                        name='Candlestick'
+                    go.Bar(
+                        x=buckets.index,
+                        y=buckets['Volume'],
+                        marker_color=np.where(buckets['Close'].pct_change() < 0, 'red', 'green'),
+                        name="Volume"
                     ),
-                    secondary_y=True
+                    secondary_y=False, row=1, col=1
                 )
 
-            fig.add_trace(
-                go.Scatter(
-                    x=stock_data.index,
-                    y=stock_data['MA50'],
-                    mode='lines',
-                    name='50-day MA',
-                    line=dict(color='orange', width=1.5, dash='dash')
-                ),
-                secondary_y=True
-            )
-
-            fig.add_trace(
-                go.Bar(
-                    x=stock_data.index,
-                    y=stock_data['Volume'],
-                    marker_color=np.where(stock_data['Close'].pct_change() < 0, 'red', 'green'),
-                    name="Volume"
-                ),
-                secondary_y=False
-            )
-
-            fig.update_xaxes(
-                rangeslider_visible=False,
-                rangeselector=dict(
-                    buttons=list([
-                        dict(count=1, label="1M", step="month", stepmode="backward"),
-                        dict(count=3, label="3M", step="month", stepmode="backward"),
-                        dict(count=6, label="6M", step="month", stepmode="backward"),
-                        dict(count=1, label="YTD", step="year", stepmode="todate"),
-                        dict(count=1, label="1Y", step="year", stepmode="backward"),
-                        dict(count=3, label="3Y", step="year", stepmode="backward"),
-                        dict(count=5, label="5Y", step="year", stepmode="backward"),
-                        dict(step="all")
-                    ])
+                fig.update_xaxes(
+                    rangeslider_visible=False,
+                    rangeselector=dict(
+                        buttons=list([
+                            dict(count=1, label="1M", step="month", stepmode="backward"),
+                            dict(count=3, label="3M", step="month", stepmode="backward"),
+                            dict(count=6, label="6M", step="month", stepmode="backward"),
+                            dict(count=1, label="YTD", step="year", stepmode="todate"),
+                            dict(count=1, label="1Y", step="year", stepmode="backward"),
+                            dict(count=3, label="3Y", step="year", stepmode="backward"),
+                            dict(count=5, label="5Y", step="year", stepmode="backward"),
+                            dict(step="all")
+                        ])
+                    )
                 )
-            )
 
-            fig.update_layout(
-                title=f"{ticker} Stock Price and Volume",
-                template='plotly_white',
-                xaxis_title="Date",
-                yaxis_title="Volume",
-                yaxis2_title="Price (USD)",
-                showlegend=True,
-                height=800
-            )
+                fig.update_layout(
+                    title=f"{ticker} Stock Price and Volume",
+                    template='plotly_white',
+                    xaxis_title="Date",
+                    yaxis_title="Volume",
+                    yaxis2_title="Price (USD)",
+                    showlegend=True,
+                    height=800 + 200 * len(panels)
+                )
 
-            fig.update_yaxes(range=[0, stock_data['Volume'].max() * 1.1], secondary_y=False)
+                fig.update_yaxes(range=[0, buckets['Volume'].max() * 1.1], secondary_y=False, row=1, col=1)
+
+                if selected_indicators:
+                    # Stored with the prices and only extended when new bars arrive
+                    # Sliced by the dates of the chart: resampled bars are labelled by the start of their bucket
+                    indicators = indicator_store.get(ticker)
+                    if time_interval == "Auto":
+                        indicators = indicators.loc[pd.Timestamp(chart_range[0]):pd.Timestamp(chart_range[1])]
+                    else:
+                        indicators = indicators.loc[indicators.index >= chart_range]
+                    for name in selected_indicators:
+                        row = 1 if name in OVERLAYS else 2 + panels.index(name)
+                        for column in INDICATORS[name]:
+                            line = downsample_line(indicators[column])
+                            fig.add_trace(
+                                go.Scatter(x=line.index, y=line, mode='lines', name=column,
+                                           line=dict(width=1)),
+                                secondary_y=row == 1, row=row, col=1
+                            )
+                        if row > 1:
+                            fig.update_yaxes(title_text=name, row=row, col=1)
+                return fig
+
+            # Built once per chart parameters and price data version for all the sessions
+            fig = figure_cache.get((ticker, "Chart", chart_range, chart_type, time_interval,
+                                    tuple(selected_indicators), price_store.version(ticker)),
+                                   BuildPriceChart)
 
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.write("No data available for the selected time range.")
 
+@st.fragment
 def render_tab3():
     if ticker:
-        stock_info = yf.Ticker(ticker)
-        info = stock_info.info
+        info = info_cache.get(ticker)
 
         st.write("## Company Profile")
         st.write(info.get("longBusinessSummary", "Description not available."))
@@ -220,41 +348,29 @@ def render_tab3():
         st.table(stats_df)
 
         st.write("## Stock Price Chart")
-        interval = st.selectbox("Select Time Interval", ["1M", "3M", "6M", "YTD", "1Y", "3Y", "5Y", "Max"])
-
-        end_date = datetime.today()
-        if interval == "1M":
-            start_date = end_date - timedelta(days=30)
-        elif interval == "3M":
-            start_date = end_date - timedelta(days=90)
-        elif interval == "6M":
-            start_date = end_date - timedelta(days=180)
-        elif interval == "YTD":
-            start_date = datetime(end_date.year, 1, 1)
-        elif interval == "1Y":
-            start_date = end_date - timedelta(days=365)
-        elif interval == "3Y":
-            start_date = end_date - timedelta(days=3 * 365)
-        elif interval == "5Y":
-            start_date = end_date - timedelta(days=5 * 365)
-        else:
-            start_date = "1900-01-01"
-
-        stock_data = stock_info.history(start=start_date, end=end_date)
-
-        fig = go.Figure(data=[go.Candlestick(
-            x=stock_data.index,
-            open=stock_data['Open'],
-            high=stock_data['High'],
-            low=stock_data['Low'],
-            close=stock_data['Close']
-        )])
-        fig.update_layout(title=f"{ticker} Stock Price", xaxis_title="Date", yaxis_title="Price (USD)")
+        interval = st.selectbox("Select Time Interval", list(DURATIONS), key="tab3_duration")
+
+        stock_data = get_bars(ticker, interval)
+
+        def BuildCandlestick():
+            buckets = ohlc_buckets(stock_data)
+            fig = go.Figure(data=[go.Candlestick(
+                x=buckets.index,
+                open=buckets['Open'],
+                high=buckets['High'],
+                low=buckets['Low'],
+                close=buckets['Close']
+            )])
+            fig.update_layout(title=f"{ticker} Stock Price", xaxis_title="Date", yaxis_title="Price (USD)")
+            return fig
+
+        fig = figure_cache.get((ticker, "Summary", duration_start(interval), price_store.version(ticker)),
+                               BuildCandlestick)
         st.plotly_chart(fig, use_container_width=True)
 
         st.write("## Major Shareholders")
         try:
-            holders = stock_info.major_holders
+            holders = prefetcher.get(ticker, "holders")
             holders_data = {
                 "Description": [
                     "% of Shares Held by All Insider",
@@ -275,44 +391,308 @@ def render_tab3():
             st.write("Shareholder information is not available.")
             st.write(e)
 
+def render_portfolio_simulation():
+    """
+    This function draws the portfolio mode of the Monte Carlo section: the
+    returns of a weighted basket over a horizon, simulated from the
+    covariance of the historical daily log returns of its tickers.
+    """
+    ticker_list = constituents.symbols()
+    basket = st.radio("Basket", ["Custom", "All constituents"], horizontal=True, key="tab4_portfolio_basket")
+    if basket == "Custom":
+        tickers = st.multiselect("Tickers", ticker_list, key="tab4_portfolio_tickers",
+                                 default=[symbol for symbol in DEFAULT_WATCHLIST if symbol in set(ticker_list)])
+    else:
+        tickers = list(ticker_list)
+    col1, col2 = st.columns(2)
+    weighting = col1.selectbox("Weighting", ["Equal", "Market cap", "Custom"], key="tab4_portfolio_weighting",
+                               help="Market caps are read from the screener table.")
+    custom_weights = col2.text_input("Custom Weights", key="tab4_portfolio_weights",
+                                     help="Comma separated, in the order of the tickers.")
+    col1, col2, col3 = st.columns(3)
+    lookback = col1.selectbox("History", ["1Y", "3Y", "5Y"], key="tab4_portfolio_lookback")
+    confidence = col2.selectbox("Confidence Level", [0.95, 0.99], format_func="{:.0%}".format,
+                                key="tab4_portfolio_confidence")
+    portfolio_value = col3.number_input("Portfolio Value ($)", min_value=1000.0, value=1000000.0, step=10000.0,
+                                        key="tab4_portfolio_value")
+    num_simulations = st.slider("Number of Simulations", 1000, 200000, 100000, step=1000,
+                                key="tab4_portfolio_simulations")
+    time_horizon = st.slider("Time Horizon (Days)", 1, 250, 10, key="tab4_portfolio_horizon")
+    col1, col2 = st.columns(2)
+    seed = col1.number_input("Random Seed", min_value=0, value=42, step=1, key="tab4_portfolio_seed")
+    use_float32 = col2.checkbox("Single precision (float32)", value=True, key="tab4_portfolio_float32")
+
+    if not tickers:
+        st.warning("Please select the tickers of the portfolio.")
+        return
+    if basket == "All constituents":
+        # Only served from the return matrix: downloading ~500 histories here would block the
+        # page and wait on the ticker locks held by the background job building the matrix
+        return_matrix.start()
+        stored = set(return_matrix.tickers())
+        held = [symbol for symbol in tickers if symbol in stored]
+        # The daily refresh keeps the current matrix readable, only wait for a first build
+        if len(held) < MIN_MATRIX_COVERAGE * len(tickers):
+            st.info(f"The returns of the constituents are being stored in the background "
+                    f"({len(held)} of {len(tickers)} so far), please try again in a few minutes.")
+            return
+        if len(held) < len(tickers):
+            st.caption(f"Left out until their returns are stored: {len(tickers) - len(held)} constituents")
+        tickers = held
+
+    if weighting == "Market cap":
+        market_caps = screener.load()['market_cap'].astype(float).reindex(tickers)
+        missing = market_caps.index[market_caps.isna()]
+        if len(missing) == len(tickers):
+            screener.start()
+            st.warning("The market caps are not available yet, the screener is loading them in the "
+                       "background. Please try again in a few minutes or choose another weighting.")
+            return
+        if len(missing):
+            st.warning(f"Left out for lack of a market cap ({len(missing)}): {', '.join(missing[:20])}"
+                       f"{', ...' if len(missing) > 20 else ''}")
+        weights = market_caps.dropna()
+        tickers = list(weights.index)
+    elif weighting == "Custom":
+        try:
+            weights = pd.Series([float(weight) for weight in custom_weights.split(",")], index=tickers)
+        except ValueError:
+            st.error(f"Enter {len(tickers)} comma separated weights, one per ticker.")
+            return
+    else:
+        weights = pd.Series(1.0, index=tickers)
+
+    # Aligned returns from the return matrix, the tickers it does not hold yet are downloaded together
+    returns = return_matrix.get_returns(tickers, duration_start(lookback))
+    history = returns.notna().sum()
+    dropped = history.index[history < 0.9 * history.max()]
+    if len(dropped):
+        st.caption(f"Left out for lack of history: {', '.join(dropped)}")
+    returns = returns.drop(columns=dropped).dropna()
+    weights = weights.drop(dropped)
+    if len(returns) < 2 or weights.sum() <= 0:
+        st.error("Insufficient historical data to perform Monte Carlo simulation.")
+        return
+    weights = weights / weights.sum()
+
+    model = PortfolioModel.fit(returns.astype(np.float64), weights.to_numpy())
+    st.caption(f"Fitted on {len(returns)} days: {model.describe()}")
+    dtype = np.float32 if use_float32 else np.float64
+
+    def RunPortfolio():
+        start_time = time.perf_counter()
+        results = simulate_portfolio(model, time_horizon, num_simulations, seed=int(seed), dtype=dtype,
+                                     confidence=confidence)
+        return results, time.perf_counter() - start_time
+
+    # Kept in the session state, so other sections do not trigger a new run
+    (portfolio_returns, VaR, CVaR, contributions), elapsed = session_result(
+        "result_tab4_portfolio", (model.key, time_horizon, num_simulations, int(seed), dtype, confidence),
+        RunPortfolio)
+    st.caption(f"Simulated {num_simulations:,} paths of {len(model.tickers)} assets in {elapsed:.2f} s.")
+
+    st.write(f"### Portfolio Returns over {time_horizon} Days")
+    counts, edges = np.histogram(portfolio_returns * portfolio_value, bins=200)
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, marker_color='rgb(31, 119, 180)',
+                           name="Simulated profit and loss"))
+    fig.add_vline(x=-VaR * portfolio_value, line=dict(color='red', dash='dash'),
+                  annotation_text=f"VaR {confidence:.0%}")
+    fig.update_layout(xaxis_title="Profit and Loss (USD)", yaxis_title="Paths", bargap=0,
+                      template='plotly_white')
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.write("### Portfolio Risk Metrics")
+    st.write(f"- **Value at Risk ({confidence:.0%} confidence level):** ${VaR * portfolio_value:,.2f} ({VaR:.2%})")
+    st.write(f"- **Conditional VaR (Expected Shortfall):** ${CVaR * portfolio_value:,.2f} ({CVaR:.2%})")
+    st.write(f"- **Expected Return:** ${portfolio_returns.mean() * portfolio_value:,.2f}"
+             f" ({portfolio_returns.mean():.2%})")
+
+    st.write("### Risk Contributions")
+    variance_shares = model.weights * (model.cov @ model.weights) / (model.weights @ model.cov @ model.weights)
+    risk = pd.DataFrame({
+        'Weight': model.weights,
+        'CVaR Contribution ($)': contributions * portfolio_value,
+        'Share of CVaR': contributions / CVaR,
+        'Share of Variance': variance_shares
+    }, index=model.tickers).sort_values('CVaR Contribution ($)', ascending=False)
+    st.dataframe(risk.style.format({'Weight': '{:.2%}', 'CVaR Contribution ($)': '${:,.2f}',
+                                    'Share of CVaR': '{:.2%}', 'Share of Variance': '{:.2%}'}),
+                 use_container_width=True)
+
+@st.fragment
 def render_tab4():
     st.write("## Monte Carlo Simulation for Stock Price Prediction")
 
-    num_simulations = st.slider("Number of Simulations", 100, 2000, 500, step=100)
-    time_horizon = st.slider("Time Horizon (Days)", 30, 365, 90, step=10)
+    # The widgets of the other mode are not rendered in this run, keep their values
+    portfolio_mode = st.session_state.get("tab4_target") == "Portfolio"
+    for key in list(st.session_state):
+        if key.startswith("tab4_") and key != "tab4_target" and \
+                key.startswith("tab4_portfolio_") != portfolio_mode:
+            st.session_state[key] = st.session_state[key]
+    target = st.radio("Simulate", ["Single ticker", "Portfolio"], horizontal=True, key="tab4_target")
+    if target == "Portfolio":
+        render_portfolio_simulation()
+        return
+
+    execution_mode = st.selectbox("Execution Mode", ["In-memory", "Streaming", "Process pool"], key="tab4_mode",
+                                  help="Streaming simulates the paths in chunks and only keeps the "
+                                       "terminal prices statistics, so memory stays bounded. "
+                                       "Process pool spreads the chunks over several CPU cores.")
+    if execution_mode == "Process pool":
+        col1, col2 = st.columns(2)
+        workers = col1.number_input("Worker Processes", min_value=1, max_value=os.cpu_count() or 1,
+                                    value=os.cpu_count() or 1, step=1, key="tab4_workers")
+        compare_single = col2.checkbox("Compare with a single process", value=False, key="tab4_compare")
+    max_simulations = 50000 if execution_mode == "In-memory" else 1000000
+    num_simulations = st.slider("Number of Simulations", 100, max_simulations, 500, step=100,
+                                key=f"tab4_simulations_{max_simulations}")
+    time_horizon = st.slider("Time Horizon (Days)", 30, 365, 90, step=10, key="tab4_horizon")
+    col1, col2 = st.columns(2)
+    seed = col1.number_input("Random Seed", min_value=0, value=42, step=1, key="tab4_seed")
+    use_float32 = col2.checkbox("Single precision (float32)", value=False, key="tab4_float32")
+    chart_style = st.radio("Chart Style", ["Fan chart", "Individual paths"], horizontal=True, key="tab4_chart_style",
+                           help="The fan chart draws percentile bands of all the paths and a few "
+                                "sample paths instead of one line per path.")
+    col1, col2 = st.columns(2)
+    return_model = col1.selectbox("Return Model", list(RETURN_MODEL_OPTIONS), key="tab4_model",
+                                  help="Variance reduction does not apply to the historical bootstrap.")
+    variance_reduction = col2.selectbox("Variance Reduction", list(VARIANCE_REDUCTION_OPTIONS),
+                                        key="tab4_variance_reduction")
+    col1, col2 = st.columns(2)
+    target_error = col1.number_input("Target VaR Standard Error ($)", min_value=0.0, value=0.0, step=0.05,
+                                     key="tab4_target_error",
+                                     help="Estimate the number of simulations needed to reach this "
+                                          "precision on the Value at Risk. 0 disables the estimate.")
+
+    @st.cache_data
+    def FitReturnModel(model_name, close_prices):
+        return RETURN_MODELS[model_name].fit(close_prices)
 
     if ticker:
-        stock_info = yf.Ticker(ticker)
-        historical_data = stock_info.history(period="1y")
-        close_prices = historical_data['Close']
+        historical_data = get_bars(ticker, "1Y")
+        close_prices = historical_data['Adj Close'].dropna()
 
         if not close_prices.empty:
-            daily_returns = close_prices.pct_change().dropna()
-            mu = daily_returns.mean()
-            sigma = daily_returns.std()
-
-            last_price = close_prices[-1]
-            simulation_results = []
-            for _ in range(num_simulations):
-                prices = [last_price]
-                for _ in range(time_horizon):
-                    next_price = prices[-1] * np.exp((mu - 0.5 * sigma**2) + sigma * np.random.normal())
-                    prices.append(next_price)
-                simulation_results.append(prices)
-
-            simulation_df = pd.DataFrame(simulation_results).T
+            model = FitReturnModel(RETURN_MODEL_OPTIONS[return_model], close_prices)
+            st.caption(f"Fitted {return_model} model: {model.describe()}")
+
+            last_price = close_prices.iloc[-1]
+            dtype = np.float32 if use_float32 else np.float64
+            method = VARIANCE_REDUCTION_OPTIONS[variance_reduction]
+            if execution_mode != "In-memory":
+                n_workers = int(workers) if execution_mode == "Process pool" else 1
+                compare = execution_mode == "Process pool" and compare_single
+
+                def RunStreaming():
+                    start_time = time.perf_counter()
+                    results = simulate_streaming(
+                        last_price, model, time_horizon, num_simulations, seed=int(seed), dtype=dtype,
+                        workers=n_workers, method=method)
+                    elapsed = time.perf_counter() - start_time
+                    if not compare:
+                        return results, elapsed, None, None
+                    start_time = time.perf_counter()
+                    single_stats, _, _ = simulate_streaming(
+                        last_price, model, time_horizon, num_simulations, seed=int(seed), dtype=dtype,
+                        method=method)
+                    return results, elapsed, single_stats, time.perf_counter() - start_time
+
+                # Kept in the session state, so other sections do not trigger a new run
+                (terminal_stats, simulation_paths, bands), elapsed, single_stats, single_elapsed = \
+                    session_result("result_tab4", (ticker, model.key, last_price, time_horizon,
+                                                   num_simulations, int(seed), dtype, method,
+                                                   n_workers, compare), RunStreaming)
+
+                if compare:
+                    timings = pd.DataFrame({
+                        'Wall-clock (s)': [single_elapsed, elapsed],
+                        'Speed-up': [1.0, single_elapsed / elapsed]
+                    }, index=['1 process', f'{n_workers} processes'])
+                    st.write("### Execution Time")
+                    st.table(timings.style.format('{:.2f}'))
+                    if np.array_equal(single_stats.counts, terminal_stats.counts) and \
+                            single_stats.mean == terminal_stats.mean:
+                        st.write("Both runs produced identical terminal distributions.")
+                else:
+                    st.caption(f"Simulated {num_simulations:,} paths in {elapsed:.2f} s.")
+
+                VaR_95 = terminal_stats.percentile(5)
+                expected_price = terminal_stats.mean
+                lower_price = terminal_stats.percentile(2.5)
+                upper_price = terminal_stats.percentile(97.5)
+                errors = terminal_stats.standard_errors()
+            else:
+                # Paths are cached per ticker and extended when the sliders move up;
+                # every block of paths is an independent batch for the standard errors,
+                # plain paths are all independent so small runs use smaller batches
+                simulation_paths, new_steps = simulation_store.get_paths(
+                    ticker, model, int(seed), method, last_price, time_horizon, num_simulations,
+                    dtype=dtype)
+                num_batches = -(-num_simulations // BLOCK_SIZE)
+                if method == "plain":
+                    num_batches = max(num_batches, DEFAULT_BATCHES)
+                if new_steps < simulation_paths.size - num_simulations:
+                    st.caption(f"Reused cached paths, simulated {new_steps:,} new path-days.")
+
+                def PathMetrics():
+                    final_prices = simulation_paths[-1]
+                    return (np.percentile(final_prices, 5), np.mean(final_prices),
+                            *np.percentile(final_prices, [2.5, 97.5]),
+                            batch_standard_errors(final_prices, num_batches))
+
+                # Kept in the session state, so other sections and widgets do not recompute them
+                run_key = (ticker, model.key, last_price, int(seed), method, dtype, time_horizon,
+                           num_simulations)
+                VaR_95, expected_price, lower_price, upper_price, errors = \
+                    session_result("result_tab4_metrics", run_key, PathMetrics)
+                if chart_style == "Fan chart":
+                    bands = session_result("result_tab4_bands", run_key,
+                                           lambda: fan_bands(simulation_paths))
+            # Standard errors are ordered as the mean followed by METRIC_PERCENTILES
+            expected_error, lower_error, VaR_error, upper_error = errors
 
             st.write(f"### Simulation Results for {ticker}")
             fig = go.Figure()
 
-            for i in range(simulation_df.shape[1]):
+            days = np.arange(time_horizon + 1)
+            if chart_style == "Fan chart":
+                # Filled bands between symmetric percentiles, then the median
+                for k in range(len(FAN_PERCENTILES) // 2):
+                    low, high = FAN_PERCENTILES[k], FAN_PERCENTILES[-1 - k]
+                    fig.add_trace(go.Scatter(
+                        x=days, y=bands[k], mode='lines', line=dict(width=0),
+                        hoverinfo='skip', showlegend=False
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=days, y=bands[-1 - k], mode='lines', line=dict(width=0),
+                        fill='tonexty', fillcolor=f'rgba(31, 119, 180, {0.2 + 0.2 * k:.1f})',
+                        name=f"{low}th - {high}th percentile"
+                    ))
                 fig.add_trace(go.Scatter(
-                    x=simulation_df.index,
-                    y=simulation_df[i],
+                    x=days, y=bands[len(FAN_PERCENTILES) // 2], mode='lines',
+                    line=dict(color='rgb(31, 119, 180)', width=2), name="Median"
+                ))
+
+                # A few sample paths in a single WebGL trace, separated by gaps
+                sample = simulation_paths[:, :FAN_SAMPLE_PATHS]
+                fig.add_trace(go.Scattergl(
+                    x=np.tile(np.append(days, np.nan), sample.shape[1]),
+                    y=np.vstack([sample, np.full((1, sample.shape[1]), np.nan)]).T.ravel(),
                     mode='lines',
-                    line=dict(width=0.7),
-                    showlegend=False
+                    line=dict(width=0.7, color='rgba(100, 100, 100, 0.6)'),
+                    connectgaps=False,
+                    name="Sample paths"
                 ))
+            else:
+                # Plot a bounded number of paths, the metrics below use all of them
+                for i in range(min(simulation_paths.shape[1], MAX_PLOTTED_PATHS)):
+                    fig.add_trace(go.Scatter(
+                        x=days,
+                        y=simulation_paths[:, i],
+                        mode='lines',
+                        line=dict(width=0.7),
+                        showlegend=False
+                    ))
 
             fig.add_trace(go.Scatter(
                 x=[0, time_horizon],
@@ -332,43 +712,31 @@ def render_tab4():
 
             st.plotly_chart(fig, use_container_width=True)
 
-            final_prices = simulation_df.iloc[-1, :]
-            VaR_95 = np.percentile(final_prices, 5)
-            expected_price = np.mean(final_prices)
-
             st.write(f"### Monte Carlo Metrics")
-            st.write(f"- **Value at Risk (95% confidence level):** ${VaR_95:.2f}")
-            st.write(f"- **Expected Price:** ${expected_price:.2f}")
+            st.write(f"- **Value at Risk (95% confidence level):** ${VaR_95:.2f} (s.e. {format_error(VaR_error)})")
+            st.write(f"- **Expected Price:** ${expected_price:.2f} (s.e. {format_error(expected_error)})")
             st.write(
-                f"- **Predicted Range (95% CI):** ${np.percentile(final_prices, 2.5):.2f} to ${np.percentile(final_prices, 97.5):.2f}"
+                f"- **Predicted Range (95% CI):** ${lower_price:.2f} to ${upper_price:.2f}"
+                f" (s.e. {format_error(lower_error)} / {format_error(upper_error)})"
             )
+            if target_error > 0 and np.isfinite(VaR_error):
+                # The standard error shrinks with the square root of the number of paths
+                needed = int(np.ceil(num_simulations * (VaR_error / target_error)**2))
+                st.write(f"- **Simulations needed for a VaR s.e. of ${target_error:.2f}:** ~{needed:,}")
         else:
             st.error("Insufficient historical data to perform Monte Carlo simulation.")
     else:
         st.warning("Please select a valid ticker to proceed.")
 
+@st.fragment
 def render_tab5():
     st.title("Financials")
-    statement_type = st.selectbox("Select Financial Statement", ["Income Statement", "Balance Sheet", "Cash Flow"])
-    period_type = st.selectbox("Select Period", ["Annual", "Quarterly"])
+    statement_type = st.selectbox("Select Financial Statement", ["Income Statement", "Balance Sheet", "Cash Flow"],
+                                  key="tab5_statement")
+    period_type = st.selectbox("Select Period", ["Annual", "Quarterly"], key="tab5_period")
     if ticker:
-        stock_info = yf.Ticker(ticker)
-
-        if statement_type == "Income Statement":
-            if period_type == "Annual":
-                data = stock_info.financials
-            else:
-                data = stock_info.quarterly_financials
-        elif statement_type == "Balance Sheet":
-            if period_type == "Annual":
-                data = stock_info.balance_sheet
-            else:
-                data = stock_info.quarterly_balance_sheet
-        elif statement_type == "Cash Flow":
-            if period_type == "Annual":
-                data = stock_info.cashflow
-            else:
-                data = stock_info.quarterly_cashflow
+        # All six statements come in one batch from the statements store
+        data = prefetcher.get(ticker, "statements")[STATEMENTS[(statement_type, period_type)]]
 
         if not data.empty:
             st.write(f"### {statement_type} ({period_type})")
@@ -376,45 +744,154 @@ def render_tab5():
         else:
             st.write(f"No {statement_type} data available for the selected period.")
 
+@st.fragment
 def render_tab6():
     st.title("News")
 
     if ticker:
-        stock_info = yf.Ticker(ticker)
-        info = stock_info.info
+        info = info_cache.get(ticker)
 
         if "logo_url" in info and info["logo_url"]:
             st.image(info["logo_url"], width=150, caption=f"{info.get('shortName', ticker)} Logo")
         else:
             st.write("Company logo not available.")
 
-        if hasattr(stock_info, 'news') and stock_info.news:
-            st.write(f"### Latest News for {info.get('shortName', ticker)}")
+        live = st.toggle("Live updates", value=False, key="tab6_live",
+                         help=f"Check for new articles every {POLL_INTERVAL} seconds without "
+                              "reloading the rest of the dashboard.")
+
+        # Only this panel reruns when polling, and only new articles are fetched
+        @st.fragment(run_every=POLL_INTERVAL if live else None)
+        def NewsPanel():
+            prefetcher.get(ticker, "news")
+            articles = news_feed.latest(ticker, 10)
+            if articles:
+                st.write(f"### Latest News for {info.get('shortName', ticker)}")
+
+                for article in articles:
+                    st.write(f"**[{article['title']}]({article['link']})**")
+                    st.write(f"*{article['publisher']}*")
+                    publish_time = datetime.fromtimestamp(article['providerPublishTime']).strftime('%Y-%m-%d %H:%M:%S')
+                    st.write(f"Published at: {publish_time}")
+                    st.write("---")
+            else:
+                st.write("No recent news articles found for this company.")
 
-            articles = stock_info.news
-            for article in articles[:10]:
-                st.write(f"**[{article['title']}]({article['link']})**")
-                st.write(f"*{article['publisher']}*")
-                publish_time = datetime.fromtimestamp(article['providerPublishTime']).strftime('%Y-%m-%d %H:%M:%S')
-                st.write(f"Published at: {publish_time}")
-                st.write("---")
-        else:
-            st.write("No recent news articles found for this company.")
+        NewsPanel()
+
+@st.fragment
+def render_tab7():
+    st.title("Watchlist")
+
+    ticker_list = constituents.symbols()
+    tickers = st.multiselect("Tickers", ticker_list, key="tab7_tickers",
+                             default=[symbol for symbol in DEFAULT_WATCHLIST if symbol in set(ticker_list)])
+    duration = st.selectbox("Select Duration", list(DURATIONS), index=list(DURATIONS).index("1Y"),
+                            key="tab7_duration")
+
+    if tickers:
+        # All the tickers not stored yet are downloaded in one batched request
+        closes = get_watchlist(tickers, duration)
+        volumes = get_watchlist(tickers, duration, 'Volume')
+
+        def BuildPerformanceChart():
+            performance = closes / closes.bfill().iloc[0] * 100
+            fig = go.Figure()
+            for symbol in tickers:
+                line = downsample_line(performance[symbol])
+                fig.add_trace(go.Scatter(x=line.index, y=line, mode='lines', name=symbol))
+            fig.update_layout(title="Performance (rebased to 100)", xaxis_title="Date",
+                              yaxis_title="Value of 100 invested", template='plotly_white', height=600)
+            return fig
+
+        fig = figure_cache.get((tuple(tickers), "Watchlist", duration_start(duration),
+                                tuple(price_store.version(symbol) for symbol in tickers)),
+                               BuildPerformanceChart)
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.write("### Returns and Volume")
+        log_returns = np.log(closes).diff()
+        summary = pd.DataFrame({
+            'Last Close': closes.ffill().iloc[-1],
+            'Return': closes.ffill().iloc[-1] / closes.bfill().iloc[0] - 1,
+            '1M Return': closes.ffill().iloc[-1] / closes.ffill().iloc[max(len(closes) - 22, 0)] - 1,
+            'Annualized Volatility': log_returns.std() * np.sqrt(TRADING_DAYS),
+            'Average Volume': volumes.mean()
+        })
+        st.dataframe(summary.style.format({'Last Close': '${:.2f}', 'Return': '{:.2%}',
+                                           '1M Return': '{:.2%}', 'Annualized Volatility': '{:.2%}',
+                                           'Average Volume': '{:,.0f}'}),
+                     use_container_width=True)
+
+        fig = go.Figure(go.Bar(x=summary.index, y=summary['Average Volume'], name="Average Volume"))
+        fig.update_layout(title="Average Daily Volume", yaxis_title="Shares", template='plotly_white')
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.write("Select the tickers to compare.")
+
+@st.fragment
+def render_tab8():
+    st.title("Screener")
+
+    # Filled in the background, the filters below only read the local table
+    screener.start()
+    table = screener.load()
+    if screener.running():
+        st.caption(f"Updating the screener data in the background: {len(table)} companies loaded.")
+    if table.empty:
+        st.write("The screener data is not available yet.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    sectors = col1.multiselect("Sectors", sorted(table['sector'].dropna().unique()), key="tab8_sectors")
+    min_market_cap = col2.number_input("Min Market Cap ($B)", min_value=0.0, value=0.0, step=10.0,
+                                       key="tab8_market_cap")
+    max_pe = col3.number_input("Max PE Ratio (0 for any)", min_value=0.0, value=0.0, step=5.0,
+                               key="tab8_pe")
+    col1, col2, col3 = st.columns(3)
+    min_yield = col1.number_input("Min Dividend Yield (%)", min_value=0.0, value=0.0, step=0.5,
+                                  key="tab8_yield")
+    min_return = col2.number_input("Min 1Y Return (%)", value=-100.0, step=5.0, key="tab8_return")
+    max_volatility = col3.number_input("Max 1Y Volatility (%)", min_value=0.0, value=200.0, step=5.0,
+                                       key="tab8_volatility")
+    col1, col2 = st.columns(2)
+    sort_by = col1.selectbox("Sort By", ["market_cap", "return_1y", "return_1m", "volatility_1y",
+                                         "pe_ratio", "dividend_yield", "beta"], key="tab8_sort")
+    ascending = col2.checkbox("Ascending", value=False, key="tab8_ascending")
+
+    selected = pd.Series(True, index=table.index)
+    if sectors:
+        selected &= table['sector'].isin(sectors)
+    if min_market_cap > 0:
+        selected &= table['market_cap'] >= min_market_cap * 1e9
+    if max_pe > 0:
+        selected &= table['pe_ratio'] <= max_pe
+    if min_yield > 0:
+        selected &= table['dividend_yield'] >= min_yield / 100
+    selected &= ~(table['return_1y'] < min_return / 100)
+    selected &= ~(table['volatility_1y'] > max_volatility / 100)
+
+    results = table.loc[selected].sort_values(sort_by, ascending=ascending).drop(columns=['updated_at'])
+    st.write(f"### {len(results)} of {len(table)} companies")
+    st.dataframe(results, use_container_width=True)
+
+# Sections of the dashboard, only the selected one runs on a rerun and the
+# widgets of a section only rerun that section (each render function is a fragment)
+SECTIONS = {"Company profile": render_tab1,
+            "Chart": render_tab2,
+            "Summary": render_tab3,
+            "Monte Carlo Simulation": render_tab4,
+            "Financial Information": render_tab5,
+            "News": render_tab6,
+            "Watchlist": render_tab7,
+            "Screener": render_tab8}
 
 render_sidebar()
 
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Company profile", "Chart", "Summary", "Monte Carlo Simulation", "Financial Information", "News"])
-with tab1:
-    render_tab1()
-with tab2:
-    render_tab2()
-with tab3:
-    render_tab3()
-with tab4:
-    render_tab4()
-with tab5:
-    render_tab5()
-with tab6:
-    render_tab6()
+section = st.radio("Section", list(SECTIONS), horizontal=True, key="section",
+                   label_visibility="collapsed")
+render_section = SECTIONS[section]
+keep_widget_state(render_section.__name__.replace("render_", ""))
+render_section()
 
     
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# TECHNICAL INDICATORS
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from market_data import get_daily
+from price_store import CACHE_DIR, MAX_TICKERS_IN_MEMORY, ParquetStore, first_revision, price_store
+
+# Indicators offered by the Chart tab and the columns drawing each of them
+INDICATORS = {"SMA 20": ["SMA 20"],
+              "SMA 200": ["SMA 200"],
+              "EMA 20": ["EMA 20"],
+              "Bollinger Bands (20, 2)": ["BB Upper", "BB Lower"],
+              "RSI 14": ["RSI 14"],
+              "MACD (12, 26, 9)": ["MACD", "MACD Signal", "MACD Histogram"],
+              "ATR 14": ["ATR 14"],
+              "Volatility 21d": ["Volatility 21d"]}
+
+# Indicators drawn over the prices, the others get their own panel
+OVERLAYS = ["SMA 20", "SMA 200", "EMA 20", "Bollinger Bands (20, 2)"]
+
+# Number of past bars the rolling-window indicators need before a new bar
+LOOKBACK = 200
+# Trading days per year, to annualize the volatility
+TRADING_DAYS = 252
+
+#==============================================================================
+# Indicators
+#==============================================================================
+
+def ema(values, alpha, previous=None):
+    """
+    This function returns the exponential moving average of values in one
+    pass of a first-order filter, y[t] = alpha * x[t] + (1 - alpha) * y[t-1].
+    It starts from previous (the average before values[0]) to continue an
+    average, else from values[0] like pandas ewm(adjust=False).
+    """
+    if len(values) == 0:
+        return values
+    start = values[0] if previous is None or np.isnan(previous) else previous
+    averages, _ = lfilter([alpha], [1, alpha - 1], values, zi=[(1 - alpha) * start])
+    return averages
+
+
+def compute_indicators(daily, start=0, previous=None):
+    """
+    This function computes every indicator (plus the averages needed to
+    continue them, in columns starting with "_") for the bars of daily from
+    position start on. The bars before start are only used as the window
+    of the rolling indicators, and previous is the row of the bar just
+    before start, used to continue the exponential averages.
+    """
+    close = daily['Close'].to_numpy(dtype=float)
+    high = daily['High'].to_numpy(dtype=float)
+    low = daily['Low'].to_numpy(dtype=float)
+    closes = daily['Close'].astype(float)
+    state = (lambda column: None) if previous is None else previous.get
+
+    out = pd.DataFrame(index=daily.index)
+    # Close the indicators were computed from, to detect revised bars
+    out["_close"] = closes
+    out["SMA 20"] = closes.rolling(20).mean()
+    out["SMA 200"] = closes.rolling(200).mean()
+    deviation = closes.rolling(20).std()
+    out["BB Upper"] = out["SMA 20"] + 2 * deviation
+    out["BB Lower"] = out["SMA 20"] - 2 * deviation
+    out["Volatility 21d"] = np.log(closes).diff().rolling(21).std() * np.sqrt(TRADING_DAYS)
+    out = out.iloc[start:]
+
+    # Recursive indicators: one filter pass over the new bars only
+    change = np.diff(close, prepend=close[0])[start:]
+    previous_close = np.concatenate([[close[0]], close[:-1]])
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close),
+                                             np.abs(low - previous_close)))[start:]
+    out["EMA 20"] = ema(close[start:], 2 / 21, state("EMA 20"))
+    out["_ema_12"] = ema(close[start:], 2 / 13, state("_ema_12"))
+    out["_ema_26"] = ema(close[start:], 2 / 27, state("_ema_26"))
+    out["MACD"] = out["_ema_12"] - out["_ema_26"]
+    out["MACD Signal"] = ema(out["MACD"].to_numpy(), 2 / 10, state("MACD Signal"))
+    out["MACD Histogram"] = out["MACD"] - out["MACD Signal"]
+    out["_rsi_gain"] = ema(np.clip(change, 0, None), 1 / 14, state("_rsi_gain"))
+    out["_rsi_loss"] = ema(np.clip(-change, 0, None), 1 / 14, state("_rsi_loss"))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out["RSI 14"] = 100 - 100 / (1 + out["_rsi_gain"] / out["_rsi_loss"])
+    out["ATR 14"] = ema(true_range, 1 / 14, state("ATR 14"))
+    return out
+
+
+def update_indicators(daily, stored):
+    """
+    This function returns the indicators of daily, reusing the stored ones:
+    only the bars from the last stored one (which may have been revised) on,
+    or from the first bar revised by a split, are computed, with LOOKBACK
+    bars of context.
+    """
+    if stored is None or stored.empty or daily.empty or daily.index[0] != stored.index[0] \
+            or "_close" not in stored:
+        return compute_indicators(daily)
+    position = daily.index.searchsorted(stored.index[-1])
+    if position == 0 or position >= len(daily) or daily.index[position] != stored.index[-1]:
+        return compute_indicators(daily)
+    revision = first_revision(stored.rename(columns={"_close": "Close"}), daily, ["Close"])
+    if revision is not None:
+        position = daily.index.searchsorted(revision)
+        if position == 0:
+            return compute_indicators(daily)
+    context = max(position - LOOKBACK, 0)
+    fresh = compute_indicators(daily.iloc[context:], position - context, stored.iloc[position - 1])
+    return pd.concat([stored.iloc[:position], fresh])
+
+#==============================================================================
+# Indicator store
+#==============================================================================
+
+class IndicatorStore(ParquetStore):
+    """
+    This class keeps the indicators of every ticker in a Parquet file next
+    to the price store, tagged with the price store version they were
+    computed from. When new bars are stored, the indicators are extended
+    with update_indicators instead of being computed over the full history,
+    from the first revised bar if a split rewrote the history.
+    """
+
+    def __init__(self, directory=CACHE_DIR / "indicators", max_in_memory=MAX_TICKERS_IN_MEMORY):
+        super().__init__(directory, max_in_memory=max_in_memory)
+
+    def get(self, ticker):
+        """
+        This function returns the indicators of a ticker, indexed like its
+        daily history.
+        """
+        daily = get_daily(ticker)
+        version = price_store.version(ticker)
+        with self.ticker_lock(ticker):
+            indicators, meta = self.load(ticker)
+            if indicators is None or meta.get('version') != version:
+                indicators = update_indicators(daily, indicators)
+                self.save(ticker, indicators, {'version': version})
+        return indicators
+
+# Store shared by all the sessions of the dashboard
+indicator_store = IndicatorStore()
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# COMPANY INFORMATION CACHE
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import yfinance as yf
+
+# Seconds before a cached company information is refreshed
+INFO_TTL = float(os.environ.get("FINAPP_INFO_TTL", 15 * 60))
+# Maximum number of (source, ticker) entries kept
+MAX_ENTRIES = 1024
+
+#==============================================================================
+# Info cache
+#==============================================================================
+
+class InfoCache:
+    """
+    This class caches company information (the .info dictionaries) for all
+    the tabs, sessions and dashboards of the process.
+
+    - Fresh entries (younger than ttl seconds) are returned directly.
+    - Stale entries are returned immediately while a background thread
+      fetches a new version (stale-while-revalidate).
+    - Concurrent requests for the same ticker share a single fetch.
+
+    Fetch functions are registered by source name, e.g. "yfinance" for
+    yf.Ticker(ticker).info or "yahoo" for the YFinance hot-fix class.
+    """
+
+    def __init__(self, ttl=INFO_TTL, max_entries=MAX_ENTRIES, max_workers=4):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sources = {"yfinance": lambda ticker: yf.Ticker(ticker).info}
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="info-cache")
+
+    def register_source(self, source, fetch):
+        """
+        This function registers (or replaces) the fetch function of a source.
+        """
+        self.sources[source] = fetch
+
+    def get(self, ticker, source="yfinance"):
+        """
+        This function returns the company information of a ticker. It only
+        blocks when nothing is cached yet; errors of that first fetch are
+        raised to the caller.
+        """
+        key = (source, ticker)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                value, fetched_at = entry
+                if time.monotonic() - fetched_at < self.ttl:
+                    return value
+
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._fetch, key)
+                self._inflight[key] = future
+
+        if entry is not None:
+            return value
+        return future.result()
+
+    def _fetch(self, key):
+        """
+        This function fetches one entry and stores it, runs in the executor.
+        """
+        source, ticker = key
+        try:
+            value = self.sources[source](ticker)
+            with self._lock:
+                self._entries[key] = (value, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+# Cache shared by all the sessions of the dashboard
+info_cache = InfoCache()
+
+###############################################################################
+# END
+###############################################################################
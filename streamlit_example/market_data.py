@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MARKET DATA ACCESS LAYER
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+from datetime import datetime
+import pandas as pd
+from price_store import EARLIEST_DATE, price_store
+
+# Durations offered by the chart selectors, in calendar days
+DURATIONS = {"1M": 30, "3M": 90, "6M": 180, "YTD": None, "1Y": 365,
+             "3Y": 3 * 365, "5Y": 5 * 365, "Max": None}
+
+# Bar intervals offered by the chart selectors and their resampling rule
+INTERVALS = {"1d": None, "1mo": "MS", "1y": "YS"}
+
+# How every column is aggregated when bars are resampled
+OHLCV_AGGREGATION = {"Open": "first", "High": "max", "Low": "min", "Close": "last",
+                     "Adj Close": "last", "Volume": "sum"}
+
+#==============================================================================
+# Dates and resampling
+#==============================================================================
+
+def duration_start(duration, today=None):
+    """
+    This function returns the first date covered by one of the DURATIONS.
+    """
+    today = pd.Timestamp(today or datetime.today()).normalize()
+    if duration == "YTD":
+        return pd.Timestamp(today.year, 1, 1)
+    if duration == "Max":
+        return EARLIEST_DATE
+    return today - pd.Timedelta(days=DURATIONS[duration])
+
+
+def resample_ohlcv(daily, interval, intervals=INTERVALS):
+    """
+    This function aggregates daily bars into one of the intervals: first
+    open, highest high, lowest low, last close and summed volume. Bars are
+    labelled with the first day of their period.
+    """
+    rule = intervals[interval]
+    if rule is None or daily.empty:
+        return daily
+    aggregation = {column: how for column, how in OHLCV_AGGREGATION.items() if column in daily}
+    return daily.resample(rule, label='left', closed='left').agg(aggregation).dropna(subset=['Close'])
+
+#==============================================================================
+# Data access
+#==============================================================================
+
+def get_daily(ticker):
+    """
+    This function returns the full daily history of a ticker. It is fetched
+    once and then served from the price store, which only adds new bars.
+    """
+    return price_store.get_history(ticker, EARLIEST_DATE)
+
+
+def get_range(ticker, start, end):
+    """
+    This function returns the daily bars of a ticker between start
+    (inclusive) and end (exclusive).
+    """
+    daily = get_daily(ticker)
+    return daily.loc[(daily.index >= pd.Timestamp(start)) & (daily.index < pd.Timestamp(end))]
+
+
+def get_bars(ticker, duration, interval="1d"):
+    """
+    This function returns the bars of a ticker over one of the DURATIONS at
+    one of the INTERVALS, sliced and resampled locally from the daily
+    history.
+    """
+    daily = get_daily(ticker)
+    return resample_ohlcv(daily.loc[daily.index >= duration_start(duration)], interval)
+
+
+def get_watchlist(tickers, duration, column='Adj Close'):
+    """
+    This function returns one column of the daily bars of several tickers
+    over one of the DURATIONS, as a wide DataFrame with a column per ticker.
+    Tickers not stored yet are downloaded together in one batched request.
+    """
+    histories = price_store.get_histories(tickers, EARLIEST_DATE)
+    start = duration_start(duration)
+    wide = pd.DataFrame({ticker: histories[ticker][column] for ticker in tickers})
+    return wide.loc[wide.index >= start]
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,778 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MONTE CARLO SIMULATION ENGINE
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import multiprocessing
+import os
+import threading
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from scipy import optimize, signal
+from scipy.special import ndtri
+from scipy.stats import qmc, t as student_t
+
+# Number of paths simulated at once by the streaming engine
+DEFAULT_CHUNK_SIZE = 10000
+# Number of full paths kept by the streaming engine for plotting
+DEFAULT_SAMPLE_SIZE = 200
+# Number of log-spaced histogram bins used to track terminal prices
+DEFAULT_BINS = 4096
+# Number of log-spaced histogram bins per day used to track the fan chart bands
+DEFAULT_BAND_BINS = 1024
+# Minimum number of independent batches used to estimate standard errors
+DEFAULT_BATCHES = 20
+
+# Ways of drawing the standard normal shocks
+VARIANCE_REDUCTION_METHODS = ("plain", "antithetic", "moment_matching", "sobol")
+# Percentiles of the terminal price reported next to the mean
+METRIC_PERCENTILES = (2.5, 5, 97.5)
+# Percentiles of the daily prices drawn as bands in the fan chart
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+
+#==============================================================================
+# Shocks and variance reduction
+#==============================================================================
+
+def draw_shocks(rng, time_horizon, num_simulations, method="plain", dtype=np.float64):
+    """
+    This function draws a (time_horizon, num_simulations) array of standard
+    normal shocks with one of the VARIANCE_REDUCTION_METHODS:
+        - plain: pseudo-random draws
+        - antithetic: pairs of paths driven by Z and -Z (adjacent columns)
+        - moment_matching: each day rescaled to mean 0 and standard deviation 1
+        - sobol: scrambled Sobol points mapped through the inverse normal
+    """
+    dtype = np.dtype(dtype)
+    if method == "plain":
+        shocks = rng.standard_normal((time_horizon, num_simulations), dtype=dtype)
+    elif method == "antithetic":
+        half = rng.standard_normal((time_horizon, -(-num_simulations // 2)), dtype=dtype)
+        shocks = np.stack([half, -half], axis=2).reshape(time_horizon, -1)[:, :num_simulations]
+    elif method == "moment_matching":
+        shocks = rng.standard_normal((time_horizon, num_simulations), dtype=dtype)
+        shocks -= shocks.mean(axis=1, keepdims=True)
+        std = shocks.std(axis=1, keepdims=True)
+        shocks /= np.where(std > 0, std, 1)
+    elif method == "sobol":
+        # Sobol balance is best for powers of 2, other sizes are still valid
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            points = qmc.Sobol(d=time_horizon, scramble=True, seed=rng).random(num_simulations)
+        eps = np.finfo(np.float64).eps
+        shocks = ndtri(np.clip(points, eps, 1 - eps)).T.astype(dtype, order='C')
+    else:
+        raise ValueError(f"Unknown variance reduction method: {method}")
+    return shocks
+
+
+def terminal_metrics(final_prices):
+    """
+    This function returns the mean followed by the METRIC_PERCENTILES of
+    an array of terminal prices.
+    """
+    return np.concatenate([[np.mean(final_prices)],
+                           np.percentile(final_prices, METRIC_PERCENTILES)])
+
+
+def _standard_errors(batch_metrics):
+    batch_metrics = np.asarray(batch_metrics)
+    if len(batch_metrics) < 2:
+        return np.full(1 + len(METRIC_PERCENTILES), np.nan)
+    return batch_metrics.std(axis=0, ddof=1) / np.sqrt(len(batch_metrics))
+
+
+def batch_standard_errors(final_prices, num_batches):
+    """
+    This function returns the standard errors of terminal_metrics, estimated
+    from the spread of the metrics across num_batches independent batches.
+    The batches must be contiguous groups of paths simulated independently,
+    such as the blocks of the simulation store.
+    """
+    return _standard_errors([terminal_metrics(batch)
+                             for batch in np.array_split(final_prices, num_batches)])
+
+def fan_bands(paths, percentiles=FAN_PERCENTILES):
+    """
+    This function returns a (len(percentiles), time_horizon + 1) array with
+    the given percentiles of the simulated prices for every day, computed in
+    one vectorized pass over the paths.
+    """
+    return np.percentile(paths, percentiles, axis=1)
+
+#==============================================================================
+# Return models
+#==============================================================================
+
+class GBMModel:
+    """
+    This class models daily log returns as (mu - sigma^2 / 2) + sigma * Z,
+    with mu and sigma the mean and standard deviation of the daily returns.
+    """
+    name = "gbm"
+
+    def __init__(self, mu, sigma):
+        self.mu = float(mu)
+        self.sigma = float(sigma)
+        self.log_mean = self.mu - 0.5 * self.sigma**2
+        self.log_std = self.sigma
+
+    @classmethod
+    def fit(cls, close_prices):
+        daily_returns = close_prices.pct_change().dropna()
+        return cls(daily_returns.mean(), daily_returns.std())
+
+    @property
+    def key(self):
+        return (self.name, self.mu, self.sigma)
+
+    def describe(self):
+        return f"mu = {self.mu:.5f}, sigma = {self.sigma:.5f}"
+
+    def log_returns(self, rng, time_horizon, num_simulations, method="plain",
+                    dtype=np.float64, state=None):
+        """
+        This function returns a (time_horizon, num_simulations) array of daily
+        log returns and the model state to continue from (None for GBM).
+        """
+        dtype = np.dtype(dtype)
+        log_returns = draw_shocks(rng, time_horizon, num_simulations, method, dtype)
+        log_returns *= dtype.type(self.sigma)
+        log_returns += dtype.type(self.log_mean)
+        return log_returns, None
+
+
+class BootstrapModel:
+    """
+    This class resamples the historical daily log returns in blocks of
+    block_length consecutive days (moving block bootstrap), which keeps their
+    fat tails and short-term dependence. Variance reduction does not apply.
+    The block starts are drawn day by day when a block begins, and the state
+    is the current block of every path, so continuing a horizon draws the
+    same returns as simulating the longer horizon at once.
+    """
+    name = "bootstrap"
+
+    def __init__(self, returns, block_length=5):
+        self.returns = np.asarray(returns, dtype=np.float64)
+        self.block_length = max(1, min(int(block_length), len(self.returns)))
+        self.log_mean = self.returns.mean()
+        self.log_std = self.returns.std()
+
+    @classmethod
+    def fit(cls, close_prices, block_length=5):
+        return cls(np.log(close_prices).diff().dropna().to_numpy(), block_length)
+
+    @property
+    def key(self):
+        return (self.name, self.block_length, self.returns.tobytes())
+
+    def describe(self):
+        return f"{len(self.returns)} historical returns, blocks of {self.block_length} days"
+
+    def log_returns(self, rng, time_horizon, num_simulations, method="plain",
+                    dtype=np.float64, state=None):
+        starts, offset = (None, 0) if state is None else state
+        # Position of every day in its block, a new block starts at position 0
+        positions = (offset + np.arange(time_horizon)) % self.block_length
+        block = np.cumsum(positions == 0)
+        drawn = rng.integers(0, len(self.returns) - self.block_length + 1,
+                             size=(block[-1], num_simulations))
+        if starts is None:
+            block -= 1
+        else:
+            drawn = np.concatenate([starts[None], drawn])
+        index = drawn[block] + positions[:, None]
+        log_returns = self.returns[index].astype(dtype)
+        return log_returns, (drawn[block[-1]], (offset + time_horizon) % self.block_length)
+
+
+class StudentTModel:
+    """
+    This class models daily log returns as loc + scale * T, with T a
+    Student-t variable fitted by maximum likelihood. T is built as
+    Z / sqrt(W / df) with W chi-squared, so the variance reduction method
+    still drives the normal part Z. W is drawn from a generator spawned from
+    rng, kept as the state, so that continuing a horizon draws the same Z
+    and W as simulating the longer horizon at once.
+    """
+    name = "student_t"
+
+    def __init__(self, df, loc, scale):
+        self.df = float(df)
+        self.loc = float(loc)
+        self.scale = float(scale)
+        self.log_mean = self.loc
+        self.log_std = self.scale * (np.sqrt(self.df / (self.df - 2)) if self.df > 2 else 3.0)
+
+    @classmethod
+    def fit(cls, close_prices):
+        return cls(*student_t.fit(np.log(close_prices).diff().dropna().to_numpy()))
+
+    @property
+    def key(self):
+        return (self.name, self.df, self.loc, self.scale)
+
+    def describe(self):
+        return f"df = {self.df:.2f}, loc = {self.loc:.5f}, scale = {self.scale:.5f}"
+
+    def log_returns(self, rng, time_horizon, num_simulations, method="plain",
+                    dtype=np.float64, state=None):
+        dtype = np.dtype(dtype)
+        mixing_rng = rng.spawn(1)[0] if state is None else state
+        log_returns = draw_shocks(rng, time_horizon, num_simulations, method, dtype)
+        # chi2(df) / df == standard_gamma(df / 2) / (df / 2)
+        mixing = mixing_rng.standard_gamma(self.df / 2, size=log_returns.shape, dtype=dtype)
+        mixing /= dtype.type(self.df / 2)
+        np.sqrt(mixing, out=mixing)
+        log_returns /= mixing
+        log_returns *= dtype.type(self.scale)
+        log_returns += dtype.type(self.loc)
+        return log_returns, mixing_rng
+
+
+class GarchModel:
+    """
+    This class models daily log returns as mu + sqrt(h_t) * Z_t with the
+    GARCH(1,1) variance recursion h_t = omega + alpha * e_{t-1}^2 + beta * h_{t-1}.
+    The parameters are fitted by Gaussian maximum likelihood with variance
+    targeting. The recursion runs over the days, vectorized across the paths;
+    the state is the next day's variance of every path.
+    """
+    name = "garch"
+
+    def __init__(self, mu, omega, alpha, beta, next_variance):
+        self.mu = float(mu)
+        self.omega = float(omega)
+        self.alpha = float(alpha)
+        self.beta = float(beta)
+        self.next_variance = float(next_variance)
+        self.log_mean = self.mu
+        self.log_std = np.sqrt(max(self.omega / max(1 - self.alpha - self.beta, 1e-6),
+                                   self.next_variance))
+
+    @staticmethod
+    def _variances(params, residuals, variance):
+        """
+        This function runs the variance recursion over the residuals,
+        starting from variance, and returns the conditional variance of the
+        day following each residual.
+        """
+        alpha, beta = params
+        omega = variance * (1 - alpha - beta)
+        inputs = omega + alpha * residuals**2
+        return signal.lfilter([1], [1, -beta], inputs, zi=[beta * variance])[0]
+
+    @classmethod
+    def fit(cls, close_prices):
+        log_returns = np.log(close_prices).diff().dropna().to_numpy()
+        mu = log_returns.mean()
+        residuals = log_returns - mu
+        variance = residuals.var()
+
+        def negative_log_likelihood(params):
+            if params.sum() >= 0.999:
+                return np.inf
+            h = np.concatenate([[variance], cls._variances(params, residuals, variance)[:-1]])
+            return 0.5 * np.sum(np.log(h) + residuals**2 / h)
+
+        result = optimize.minimize(negative_log_likelihood, x0=[0.05, 0.90], method="Nelder-Mead",
+                                   bounds=[(0.0, 0.999), (0.0, 0.999)])
+        alpha, beta = result.x if np.isfinite(result.fun) else (0.0, 0.0)
+        next_variance = cls._variances((alpha, beta), residuals, variance)[-1]
+        return cls(mu, variance * (1 - alpha - beta), alpha, beta, next_variance)
+
+    @property
+    def key(self):
+        return (self.name, self.mu, self.omega, self.alpha, self.beta, self.next_variance)
+
+    def describe(self):
+        return (f"mu = {self.mu:.5f}, omega = {self.omega:.2e}, "
+                f"alpha = {self.alpha:.3f}, beta = {self.beta:.3f}")
+
+    def log_returns(self, rng, time_horizon, num_simulations, method="plain",
+                    dtype=np.float64, state=None):
+        shocks = draw_shocks(rng, time_horizon, num_simulations, method, np.dtype(dtype))
+        return self.returns_from_shocks(shocks, state)
+
+    def returns_from_shocks(self, shocks, state=None):
+        """
+        This function runs the variance recursion over a (time_horizon,
+        num_simulations) array of shocks, turned into log returns in place,
+        so shocks drawn separately (e.g. per block of paths) can share one
+        pass over the days.
+        """
+        log_returns = shocks
+        dtype = log_returns.dtype
+        variance = (np.full(log_returns.shape[1], self.next_variance, dtype=dtype)
+                    if state is None else np.array(state, dtype=dtype))
+        for day in range(len(log_returns)):
+            log_returns[day] *= np.sqrt(variance)
+            variance = dtype.type(self.omega) + dtype.type(self.alpha) * log_returns[day]**2 + \
+                dtype.type(self.beta) * variance
+        log_returns += dtype.type(self.mu)
+        return log_returns, variance
+
+# Return models selectable in the dashboard
+RETURN_MODELS = {model.name: model for model in (GBMModel, BootstrapModel, StudentTModel, GarchModel)}
+
+#==============================================================================
+# Path simulation
+#==============================================================================
+
+def paths_from_log_returns(last_price, log_returns):
+    """
+    This function turns a (time_horizon, num_simulations) array of daily log
+    returns into price paths with a cumulative sum in log space. The result
+    has time_horizon + 1 rows (row 0 is last_price). last_price may also be
+    an array with one starting price per path.
+    """
+    time_horizon, num_simulations = log_returns.shape
+    paths = np.empty((time_horizon + 1, num_simulations), dtype=log_returns.dtype)
+    paths[0] = 0
+    np.cumsum(log_returns, axis=0, out=paths[1:])
+    np.exp(paths, out=paths)
+    paths *= np.asarray(last_price, dtype=log_returns.dtype)
+    return paths
+
+
+def simulate_paths(last_price, model, time_horizon, num_simulations,
+                   seed=None, dtype=np.float64, method="plain"):
+    """
+    This function simulates price paths with one of the RETURN_MODELS.
+
+    All the daily log returns are drawn at once as a
+    (time_horizon, num_simulations) array from a seeded numpy Generator and
+    the result has one column per simulated path (see paths_from_log_returns).
+    Pass dtype=np.float32 to halve the memory footprint. seed may also be a
+    Generator that is advanced in place.
+    """
+    rng = np.random.default_rng(seed)
+    log_returns, _ = model.log_returns(rng, time_horizon, num_simulations, method, dtype)
+    return paths_from_log_returns(last_price, log_returns)
+
+#==============================================================================
+# Streaming simulation
+#==============================================================================
+
+class TerminalStats:
+    """
+    This class accumulates statistics of simulated terminal prices chunk by
+    chunk in a fixed amount of memory.
+
+    The mean and the standard deviation are merged exactly (Chan et al.),
+    percentiles are read from a log-spaced histogram between low and high
+    with one underflow and one overflow bin. The terminal_metrics of every
+    chunk are kept to estimate standard errors.
+    """
+
+    def __init__(self, low, high, bins=DEFAULT_BINS):
+        self.edges = np.geomspace(low, high, bins + 1)
+        self.counts = np.zeros(bins + 2, dtype=np.int64)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.batch_metrics = []
+
+    def update(self, prices):
+        """
+        This function adds a chunk of terminal prices to the statistics.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        if prices.size == 0:
+            return
+
+        other = TerminalStats.__new__(TerminalStats)
+        other.edges = self.edges
+        other.counts = np.bincount(np.searchsorted(self.edges, prices, side='right'),
+                                   minlength=self.counts.size)
+        other.count = prices.size
+        other.mean = prices.mean()
+        other.m2 = np.square(prices - other.mean).sum()
+        other.min = prices.min()
+        other.max = prices.max()
+        other.batch_metrics = [terminal_metrics(prices)]
+        self.merge(other)
+
+    def merge(self, other):
+        """
+        This function merges the statistics of another chunk (with the same
+        histogram edges) into this one.
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.counts += other.counts
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.batch_metrics.extend(other.batch_metrics)
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def standard_errors(self):
+        """
+        This function returns the standard errors of terminal_metrics,
+        estimated from the spread of the metrics across the chunks.
+        """
+        return _standard_errors(self.batch_metrics)
+
+    def percentile(self, q):
+        """
+        This function estimates the q-th percentile (0-100) of the terminal
+        prices by interpolating inside the histogram bin in log space.
+        """
+        rank = q / 100 * self.count
+        cumulative = np.cumsum(self.counts)
+        i = min(int(np.searchsorted(cumulative, rank, side='left')), self.counts.size - 1)
+
+        # Underflow and overflow bins are only bounded by the observed extremes
+        if i == 0:
+            return self.min
+        if i == self.counts.size - 1:
+            return self.max
+
+        below = cumulative[i - 1]
+        fraction = (rank - below) / self.counts[i] if self.counts[i] else 0.0
+        low, high = np.log(self.edges[i - 1]), np.log(self.edges[i])
+        value = np.exp(low + fraction * (high - low))
+        return float(np.clip(value, self.min, self.max))
+
+
+class BandStats:
+    """
+    This class accumulates the simulated prices of every day chunk by chunk
+    in a fixed amount of memory, as one log-spaced histogram per day between
+    lows and highs (with one underflow and one overflow bin), to read the
+    daily percentiles of all the paths like TerminalStats does for the
+    terminal prices.
+    """
+
+    def __init__(self, lows, highs, bins=DEFAULT_BAND_BINS):
+        self.log_low = np.log(np.asarray(lows, dtype=np.float64))
+        self.width = (np.log(np.asarray(highs, dtype=np.float64)) - self.log_low) / bins
+        self.counts = np.zeros((len(self.log_low), bins + 2), dtype=np.int64)
+        self.count = 0
+        self.min = np.full(len(self.log_low), np.inf)
+        self.max = np.full(len(self.log_low), -np.inf)
+
+    def update(self, paths):
+        """
+        This function adds a chunk of (days, paths) simulated prices to the
+        histograms.
+        """
+        days, num_paths = paths.shape
+        if num_paths == 0:
+            return
+        bins = self.counts.shape[1]
+        position = (np.log(paths, dtype=np.float64) - self.log_low[:, None]) / self.width[:, None]
+        index = np.clip(np.floor(position), -1, bins - 2).astype(np.int64) + 1
+        index += bins * np.arange(days)[:, None]
+        self.counts += np.bincount(index.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+        self.count += num_paths
+        self.min = np.minimum(self.min, paths.min(axis=1))
+        self.max = np.maximum(self.max, paths.max(axis=1))
+
+    def merge(self, other):
+        """
+        This function merges the histograms of another chunk (with the same
+        ranges) into this one.
+        """
+        self.counts += other.counts
+        self.count += other.count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def percentiles(self, percentiles=FAN_PERCENTILES):
+        """
+        This function returns a (len(percentiles), days) array with the given
+        percentiles of the prices of every day, interpolated inside the
+        histogram bins in log space, as in fan_bands.
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        days = np.arange(len(cumulative))
+        last = self.counts.shape[1] - 1
+        bands = []
+        for q in percentiles:
+            rank = q / 100 * self.count
+            i = np.minimum((cumulative < rank).sum(axis=1), last)
+            below = np.where(i > 0, cumulative[days, np.maximum(i - 1, 0)], 0)
+            in_bin = self.counts[days, i]
+            fraction = np.divide(rank - below, in_bin, out=np.zeros(len(days)), where=in_bin > 0)
+            value = np.clip(np.exp(self.log_low + (i - 1 + fraction) * self.width), self.min, self.max)
+            # Underflow and overflow bins are only bounded by the observed extremes
+            bands.append(np.where(i == 0, self.min, np.where(i == last, self.max, value)))
+        return np.array(bands)
+
+
+def terminal_range(model, last_price, time_horizon, width=10.0):
+    """
+    This function returns a (low, high) price range covering +/- width
+    standard deviations of the model's terminal log price.
+    """
+    center = np.log(last_price) + model.log_mean * time_horizon
+    spread = width * np.maximum(model.log_std * np.sqrt(time_horizon), 1e-6)
+    return np.exp(center - spread), np.exp(center + spread)
+
+
+def _simulate_chunk(task):
+    """
+    This function simulates one chunk of the streaming engine. It is a module
+    level function so it can be sent to the worker processes.
+    """
+    last_price, model, time_horizon, size, chunk_seed, dtype, method, keep, price_range, band_range = task
+    paths = simulate_paths(last_price, model, time_horizon, size,
+                           seed=chunk_seed, dtype=dtype, method=method)
+    stats = TerminalStats(*price_range)
+    stats.update(paths[-1])
+    bands = BandStats(*band_range)
+    bands.update(paths)
+    return stats, paths[:, :keep].copy(), bands
+
+
+def _get_pool():
+    """
+    This function returns the process pool shared by all the sessions, with
+    one worker per CPU, starting it on the first call so the worker start-up
+    cost is only paid once. Each run caps how many of its chunks are in
+    flight (see _pool_map), so the number of processes does not depend on
+    the worker counts picked in the dashboard.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _replace_pool(broken):
+    """
+    This function replaces the shared pool after one of its workers died,
+    unless another run already replaced it, and returns the new pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+            broken.shutdown(wait=False, cancel_futures=True)
+    return _get_pool()
+
+
+def _pool_map(tasks, in_flight):
+    """
+    This function yields the results of _simulate_chunk over the tasks, in
+    order, with at most in_flight of them submitted to the shared pool at a
+    time. If the pool breaks, it is replaced once and the chunks not yielded
+    yet are submitted again (a chunk only depends on its task).
+    """
+    pool = _get_pool()
+    pending = deque()
+    done = 0
+    replaced = False
+    try:
+        while done < len(tasks):
+            try:
+                while len(pending) < in_flight and done + len(pending) < len(tasks):
+                    pending.append(pool.submit(_simulate_chunk, tasks[done + len(pending)]))
+                result = pending[0].result()
+            except BrokenProcessPool:
+                if replaced:
+                    raise
+                pending.clear()
+                pool = _replace_pool(pool)
+                replaced = True
+                continue
+            pending.popleft()
+            done += 1
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def simulate_streaming(last_price, model, time_horizon, num_simulations,
+                       seed=None, dtype=np.float64,
+                       chunk_size=DEFAULT_CHUNK_SIZE,
+                       sample_size=DEFAULT_SAMPLE_SIZE,
+                       workers=1, method="plain"):
+    """
+    This function simulates price paths with one of the RETURN_MODELS in
+    fixed-size chunks and only keeps the terminal price statistics plus the
+    first sample_size full paths.
+
+    Each chunk draws from its own child of SeedSequence(seed), so the result
+    only depends on the seed and the chunk size. Peak memory is bounded by
+    one chunk of paths per worker regardless of num_simulations. Small runs
+    use smaller chunks so that there are at least DEFAULT_BATCHES of them to
+    estimate standard errors; the variance reduction method is applied
+    independently inside each chunk.
+
+    With workers > 1 up to workers chunks at a time are spread over the
+    shared process pool. The chunk
+    statistics are merged back in chunk order, so the result is bit-identical
+    whatever the number of workers.
+
+    Returns a (TerminalStats, sample_paths, bands) tuple, where sample_paths
+    has shape (time_horizon + 1, min(sample_size, num_simulations)) and bands
+    holds the daily FAN_PERCENTILES of all the paths, read from the merged
+    daily histograms of the chunks (see BandStats), as in fan_bands.
+    """
+    price_range = terminal_range(model, last_price, time_horizon)
+    band_range = terminal_range(model, last_price, np.arange(time_horizon + 1))
+    chunk_size = min(chunk_size, max(1, -(-num_simulations // DEFAULT_BATCHES)))
+    num_chunks = -(-num_simulations // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(num_chunks)
+
+    tasks = []
+    for i, chunk_seed in enumerate(seeds):
+        size = min(chunk_size, num_simulations - i * chunk_size)
+        keep = min(size, max(0, sample_size - i * chunk_size))
+        tasks.append((float(last_price), model, time_horizon, size,
+                      chunk_seed, np.dtype(dtype), method, keep, price_range, band_range))
+
+    if workers > 1 and num_chunks > 1:
+        results = _pool_map(tasks, workers)
+    else:
+        results = map(_simulate_chunk, tasks)
+
+    stats = TerminalStats(*price_range)
+    bands = BandStats(*band_range)
+    samples = []
+    for chunk_stats, chunk_sample, chunk_bands in results:
+        stats.merge(chunk_stats)
+        bands.merge(chunk_bands)
+        samples.append(chunk_sample)
+
+    return stats, np.concatenate(samples, axis=1), bands.percentiles()
+
+#==============================================================================
+# Portfolio simulation
+#==============================================================================
+
+def covariance_factor(cov):
+    """
+    This function returns a matrix L with L @ L.T == cov: the Cholesky factor,
+    or, when cov is only positive semi-definite (more assets than days of
+    history, duplicated share classes), the eigenvector factor with the
+    negative eigenvalues clipped to 0.
+    """
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        return vectors * np.sqrt(np.clip(values, 0, None))
+
+
+class PortfolioModel:
+    """
+    This class models the daily log returns of a basket of assets as a
+    multivariate normal with the mean vector and covariance matrix of their
+    historical daily log returns. Daily returns being i.i.d., the log returns
+    over T days are drawn directly as N(T * mean, T * cov), so the cost of a
+    simulation does not depend on the horizon.
+    """
+    name = "portfolio"
+
+    def __init__(self, tickers, weights, mean, cov):
+        self.tickers = list(tickers)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.cov = np.asarray(cov, dtype=np.float64)
+        self.factor = covariance_factor(self.cov)
+
+    @classmethod
+    def fit(cls, log_returns, weights):
+        """
+        This function fits the model to a DataFrame of daily log returns with
+        a column per asset, on the days where all of them have a return.
+        """
+        log_returns = log_returns.dropna()
+        return cls(log_returns.columns, weights, log_returns.mean(), log_returns.cov())
+
+    @property
+    def key(self):
+        return (self.name, tuple(self.tickers), self.weights.tobytes(), self.mean.tobytes(),
+                self.cov.tobytes())
+
+    def describe(self):
+        volatility = np.sqrt(self.weights @ self.cov @ self.weights)
+        return f"{len(self.tickers)} assets, daily portfolio volatility = {volatility:.5f}"
+
+    def horizon_returns(self, rng, time_horizon, num_simulations, dtype=np.float64):
+        """
+        This function returns a (num_simulations, assets) array of simple
+        returns over time_horizon days: the correlated shocks of all the
+        paths are made in one matrix multiply of the standard normal draws by
+        the (transposed) covariance factor.
+        """
+        dtype = np.dtype(dtype)
+        shocks = rng.standard_normal((num_simulations, len(self.tickers)), dtype=dtype)
+        returns = shocks @ (np.sqrt(time_horizon) * self.factor.T).astype(dtype)
+        returns += (time_horizon * self.mean).astype(dtype)
+        np.expm1(returns, out=returns)
+        return returns
+
+
+def simulate_portfolio(model, time_horizon, num_simulations, seed=None, dtype=np.float64,
+                       confidence=0.95, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    This function simulates the return of a PortfolioModel basket over
+    time_horizon days and returns a (portfolio_returns, VaR, CVaR,
+    contributions) tuple:
+        - portfolio_returns: the num_simulations simulated portfolio returns
+        - VaR, CVaR: the loss (as a fraction of the portfolio value) at the
+          confidence level and the average loss beyond it
+        - contributions: the share of every asset in the CVaR (Euler
+          allocation, the average weighted asset loss on the tail paths),
+          which sums to the CVaR
+
+    The paths are simulated in chunks, each drawn from its own child of
+    SeedSequence(seed), so peak memory is one chunk of asset returns. The
+    tail is only known once all the portfolio returns are simulated, so the
+    contributions are accumulated in a second pass over the same chunks.
+    """
+    num_chunks = -(-num_simulations // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(num_chunks)
+    sizes = [min(chunk_size, num_simulations - i * chunk_size) for i in range(num_chunks)]
+    weights = model.weights.astype(dtype)
+
+    portfolio_returns = np.concatenate([
+        model.horizon_returns(np.random.default_rng(chunk_seed), time_horizon, size, dtype) @ weights
+        for chunk_seed, size in zip(seeds, sizes)])
+    threshold = np.percentile(portfolio_returns, 100 * (1 - confidence))
+    tail = portfolio_returns <= threshold
+
+    tail_sum = np.zeros(len(model.tickers))
+    first = 0
+    for chunk_seed, size in zip(seeds, sizes):
+        chunk_tail = tail[first:first + size]
+        if chunk_tail.any():
+            returns = model.horizon_returns(np.random.default_rng(chunk_seed), time_horizon, size, dtype)
+            tail_sum += returns[chunk_tail].sum(axis=0, dtype=np.float64)
+        first += size
+    contributions = -model.weights * tail_sum / tail.sum()
+
+    return portfolio_returns, -threshold, -portfolio_returns[tail].mean(), contributions
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# INCREMENTAL NEWS FEED
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import threading
+import time
+from collections import deque
+import yfinance as yf
+
+# Articles kept for every ticker (oldest ones are dropped first)
+ARTICLES_PER_TICKER = 50
+# Articles kept for all the tickers together
+MAX_ARTICLES = 2000
+# Minimum time between two news requests for a ticker, in seconds
+POLL_INTERVAL = 60
+
+#==============================================================================
+# News feed
+#==============================================================================
+
+def download_news(ticker):
+    """
+    This function downloads the latest news articles of a ticker.
+    """
+    return yf.Ticker(ticker).news or []
+
+
+class NewsFeed:
+    """
+    This class keeps a ring buffer of news articles for every ticker.
+
+    Each poll only adds the articles published since the last one seen and
+    not seen before (by their uuid); the oldest articles are dropped when a
+    ticker has more than per_ticker articles or all the tickers together
+    have more than max_articles.
+    """
+
+    def __init__(self, per_ticker=ARTICLES_PER_TICKER, max_articles=MAX_ARTICLES,
+                 poll_interval=POLL_INTERVAL, fetch=download_news):
+        self.per_ticker = per_ticker
+        self.max_articles = max_articles
+        self.poll_interval = poll_interval
+        self.fetch = fetch
+        self._feeds = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def update(self, ticker):
+        """
+        This function polls the news of a ticker, at most every poll
+        interval, and returns the number of new articles.
+        """
+        with self._lock:
+            feed = self._feeds.setdefault(ticker, {'articles': deque(), 'ids': set(),
+                                                   'last_published': 0, 'polled_at': None})
+            if feed['polled_at'] is not None and \
+                    time.monotonic() - feed['polled_at'] < self.poll_interval:
+                return 0
+            feed['polled_at'] = time.monotonic()
+
+        try:
+            articles = self.fetch(ticker)
+        except Exception:
+            with self._lock:
+                feed['polled_at'] = None
+            raise
+
+        with self._lock:
+            new = [article for article in articles
+                   if article.get('providerPublishTime', 0) >= feed['last_published']
+                   and article.get('uuid') not in feed['ids']]
+            new.sort(key=lambda article: article.get('providerPublishTime', 0))
+            for article in new:
+                feed['articles'].append(article)
+                feed['ids'].add(article.get('uuid'))
+                feed['last_published'] = article.get('providerPublishTime', 0)
+                self._size += 1
+                if len(feed['articles']) > self.per_ticker:
+                    self._drop_oldest(feed)
+            while self._size > self.max_articles:
+                # Drop the oldest article among all the tickers
+                self._drop_oldest(min((other for other in self._feeds.values() if other['articles']),
+                                      key=lambda other: other['articles'][0].get('providerPublishTime', 0)))
+        return len(new)
+
+    def latest(self, ticker, count=10):
+        """
+        This function returns the count most recent articles of a ticker,
+        newest first, polling for new ones first.
+        """
+        self.update(ticker)
+        with self._lock:
+            articles = self._feeds[ticker]['articles']
+            return [articles[-1 - i] for i in range(min(count, len(articles)))]
+
+    def _drop_oldest(self, feed):
+        article = feed['articles'].popleft()
+        feed['ids'].discard(article.get('uuid'))
+        self._size -= 1
+
+# Feed shared by all the sessions of the dashboard
+news_feed = NewsFeed()
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# CONCURRENT PREFETCH OF THE TICKER DATASETS
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import yfinance as yf
+from info_cache import info_cache
+from market_data import get_daily
+from news_feed import news_feed
+from statements_store import statements_store
+
+# Seconds a prefetched dataset is served before it is fetched again
+PREFETCH_TTL = 15 * 60
+# Number of tickers whose datasets are kept
+MAX_TICKERS = 32
+
+#==============================================================================
+# Datasets
+#==============================================================================
+
+def ticker_attribute(name):
+    """
+    This function returns a fetch function reading one attribute of
+    yf.Ticker, e.g. "major_holders".
+    """
+    return lambda ticker: getattr(yf.Ticker(ticker), name)
+
+# Every dataset used by the tabs and the function fetching it
+DATASETS = {
+    "info": info_cache.get,
+    "history": get_daily,
+    "holders": ticker_attribute("major_holders"),
+    "news": news_feed.update,
+    "statements": statements_store.get_all,
+}
+
+#==============================================================================
+# Prefetcher
+#==============================================================================
+
+class Prefetcher:
+    """
+    This class fetches all the datasets of a ticker concurrently on a thread
+    pool as soon as the ticker is selected. Each tab then only waits for the
+    future of its own dataset, so the page is ready after the slowest call
+    instead of the sum of all of them.
+
+    Futures are shared by all the sessions and reused for ttl seconds; a
+    failed fetch is retried by the next request.
+    """
+
+    def __init__(self, datasets=DATASETS, ttl=PREFETCH_TTL, max_tickers=MAX_TICKERS):
+        self.datasets = dict(datasets)
+        self.ttl = ttl
+        self.max_tickers = max_tickers
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self.datasets),
+                                            thread_name_prefix="prefetch")
+
+    def prefetch(self, ticker):
+        """
+        This function starts fetching every dataset of a ticker that is not
+        already fetched or in flight, and returns immediately.
+        """
+        for dataset in self.datasets:
+            self._future(ticker, dataset)
+
+    def get(self, ticker, dataset):
+        """
+        This function waits for one dataset of a ticker and returns it,
+        errors of the fetch are raised to the caller.
+        """
+        return self._future(ticker, dataset).result()
+
+    def _future(self, ticker, dataset):
+        """
+        This function returns the current future of a dataset, submitting a
+        new fetch if there is none, if it expired or if it failed.
+        """
+        with self._lock:
+            futures = self._futures.setdefault(ticker, {})
+            self._futures.move_to_end(ticker)
+            while len(self._futures) > self.max_tickers:
+                self._futures.popitem(last=False)
+
+            entry = futures.get(dataset)
+            if entry is not None:
+                future, submitted = entry
+                failed = future.done() and future.exception() is not None
+                if not failed and time.monotonic() - submitted < self.ttl:
+                    return future
+
+            future = self._executor.submit(self.datasets[dataset], ticker)
+            futures[dataset] = (future, time.monotonic())
+            return future
+
+# Prefetcher shared by all the sessions of the dashboard
+prefetcher = Prefetcher()
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MULTI-RESOLUTION OHLCV PYRAMID
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import pandas as pd
+from downsampling import MAX_POINTS_PER_TRACE
+from market_data import get_daily, resample_ohlcv
+from price_store import CACHE_DIR, MAX_TICKERS_IN_MEMORY, ParquetStore, first_revision, price_store
+
+# Levels of the pyramid, from the finest to the coarsest, and their resampling rule
+LEVELS = {"1d": None, "1wk": "W-MON", "1mo": "MS", "3mo": "QS"}
+
+#==============================================================================
+# Level selection
+#==============================================================================
+
+def choose_level(levels, start, end, max_points=MAX_POINTS_PER_TRACE):
+    """
+    This function returns the finest level with at most max_points bars
+    between start and end (both inclusive), else the coarsest one.
+    """
+    for level, bars in levels.items():
+        if ((bars.index >= pd.Timestamp(start)) & (bars.index <= pd.Timestamp(end))).sum() <= max_points:
+            return level
+    return level
+
+#==============================================================================
+# Pyramid store
+#==============================================================================
+
+class PricePyramid(ParquetStore):
+    """
+    This class keeps the daily, weekly, monthly and quarterly bars of every
+    ticker in Parquet files next to the price store, so a chart can show a
+    coarse level for a long range and a finer one for a zoomed window
+    without resampling the daily history on every rerun.
+
+    The levels are tagged with the price store version they were built from.
+    When new bars are stored, only the buckets from the last one of each
+    level (or from the first revised daily bar) onwards are computed again.
+    """
+
+    def __init__(self, directory=CACHE_DIR / "pyramid", max_in_memory=MAX_TICKERS_IN_MEMORY):
+        super().__init__(directory, frame_names=list(LEVELS), max_in_memory=max_in_memory)
+
+    def get_levels(self, ticker):
+        """
+        This function returns the levels of a ticker, as a dictionary of
+        DataFrames keyed by the LEVELS names.
+        """
+        daily = get_daily(ticker)
+        version = price_store.version(ticker)
+        with self.ticker_lock(ticker):
+            levels, meta = self.load(ticker)
+            if levels is None or meta.get('version') != version:
+                levels = self._build(daily, levels)
+                self.save(ticker, levels, {'version': version})
+        return levels
+
+    def _build(self, daily, levels):
+        """
+        This function updates the levels with the new daily bars, recomputing
+        each level from its last (possibly incomplete) bucket, or from the
+        bucket of the first daily bar revised by a split or a dividend (the
+        price store then rewrites the whole history). They are built from
+        scratch if older bars were added.
+        """
+        revision = None
+        if levels is not None and not levels["1d"].empty and not daily.empty:
+            revision = first_revision(levels["1d"], daily)
+        built = {}
+        for level in LEVELS:
+            previous = None if levels is None else levels[level]
+            if previous is None or previous.empty or daily.empty or daily.index[0] < previous.index[0]:
+                built[level] = resample_ohlcv(daily, level, LEVELS)
+                continue
+            since = previous.index[-1]
+            if revision is not None:
+                since = min(since, previous.index[previous.index <= revision][-1])
+            fresh = resample_ohlcv(daily.loc[daily.index >= since], level, LEVELS)
+            built[level] = pd.concat([previous.loc[previous.index < since], fresh])
+        return built
+
+# Pyramid shared by all the sessions of the dashboard
+price_pyramid = PricePyramid()
+
+###############################################################################
+# END
+###############################################################################
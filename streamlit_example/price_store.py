@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# LOCAL OHLCV PRICE STORE
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import json
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+# Directory where the dashboard keeps its local data
+CACHE_DIR = Path(os.environ.get("FINAPP_CACHE_DIR", Path(__file__).parent / "data_cache"))
+
+# Columns kept for every daily bar
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+# Start date used for the "Max" duration
+EARLIEST_DATE = pd.Timestamp("1900-01-01")
+# Minimum time between two fetches of the latest bars of a ticker
+REFRESH_INTERVAL = timedelta(minutes=15)
+# Number of tickers kept in memory on top of the files on disk
+MAX_TICKERS_IN_MEMORY = 64
+
+#==============================================================================
+# Provider
+#==============================================================================
+
+def download_daily_bars(ticker, start, end):
+    """
+    This function downloads the daily bars of a ticker from Yahoo Finance
+    between start (inclusive) and end (exclusive), as a DataFrame indexed by
+    a tz-naive 'Date' index with the PRICE_COLUMNS.
+    """
+    data = yf.download(ticker, start=start, end=end, interval="1d",
+                       auto_adjust=False, progress=False)
+    if isinstance(data.columns, pd.MultiIndex):
+        data = data.xs(ticker, axis=1, level=-1)
+    return _normalize(data)
+
+
+def download_many_daily_bars(tickers, start, end):
+    """
+    This function downloads the daily bars of several tickers in one batched
+    request (fetched concurrently by yfinance), as a dictionary of
+    DataFrames like the ones of download_daily_bars.
+    """
+    data = yf.download(list(tickers), start=start, end=end, interval="1d",
+                       auto_adjust=False, progress=False, threads=True)
+    bars = {}
+    for ticker in tickers:
+        if isinstance(data.columns, pd.MultiIndex):
+            columns = data.columns.get_level_values(-1) == ticker
+            bars[ticker] = _normalize(data.loc[:, columns].droplevel(-1, axis=1))
+        else:
+            bars[ticker] = _normalize(data)
+    return bars
+
+
+def _normalize(data):
+    data = data.reindex(columns=PRICE_COLUMNS)
+    data.index = pd.DatetimeIndex(data.index).tz_localize(None).normalize()
+    data.index.name = 'Date'
+    return data.dropna(how='all')
+
+#==============================================================================
+# Per-ticker Parquet store
+#==============================================================================
+
+class ParquetStore:
+    """
+    This class keeps DataFrames of every ticker in Parquet files, with a JSON
+    side file of dates (the covered range, the price version the frames were
+    built from, ...), and the most recently used tickers in memory. The
+    stores of the dashboard only add how their frames are fetched or built.
+
+    A ticker has one frame, written to <ticker>.parquet, or with frame_names
+    a dictionary of frames, written to <ticker>.<name>.parquet; its dates are
+    written to <ticker>.json.
+    """
+
+    def __init__(self, directory, frame_names=None, max_in_memory=MAX_TICKERS_IN_MEMORY):
+        self.directory = Path(directory)
+        self.frame_names = frame_names
+        self.max_in_memory = max_in_memory
+        self._stored = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def ticker_lock(self, ticker):
+        """
+        This function returns the lock of a ticker, to be held while its
+        frames are read, built and saved.
+        """
+        with self._lock:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def load(self, ticker):
+        """
+        This function returns the (frames, meta) of a ticker from memory or
+        disk, or (None, None) if they have never been saved.
+        """
+        with self._lock:
+            if ticker in self._stored:
+                self._stored.move_to_end(ticker)
+                return self._stored[ticker]
+
+        data_paths, meta_path = self._paths(ticker)
+        try:
+            frames = {name: self._read_frame(path) for name, path in data_paths.items()}
+            with open(meta_path) as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        meta = {key: None if value is None else pd.Timestamp(value) for key, value in raw.items()}
+        frames = frames[None] if self.frame_names is None else frames
+        self._remember(ticker, frames, meta)
+        return frames, meta
+
+    def save(self, ticker, frames, meta):
+        """
+        This function writes the frames and the dates of a ticker, replacing
+        the files atomically.
+        """
+        data_paths, meta_path = self._paths(ticker)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        by_name = {None: frames} if self.frame_names is None else frames
+        for name, path in data_paths.items():
+            self._write_frame(by_name[name], temporary_path(path))
+            os.replace(temporary_path(path), path)
+        with open(temporary_path(meta_path), 'w') as f:
+            json.dump({key: None if value is None else value.isoformat()
+                       for key, value in meta.items()}, f)
+        os.replace(temporary_path(meta_path), meta_path)
+        self._remember(ticker, frames, meta)
+
+    def _paths(self, ticker):
+        if self.frame_names is None:
+            data_paths = {None: self.directory / f"{ticker}.parquet"}
+        else:
+            data_paths = {name: self.directory / f"{ticker}.{name}.parquet" for name in self.frame_names}
+        return data_paths, self.directory / f"{ticker}.json"
+
+    def _read_frame(self, path):
+        return pd.read_parquet(path)
+
+    def _write_frame(self, frame, path):
+        frame.to_parquet(path)
+
+    def _remember(self, ticker, frames, meta):
+        with self._lock:
+            self._stored[ticker] = (frames, meta)
+            self._stored.move_to_end(ticker)
+            while len(self._stored) > self.max_in_memory:
+                self._stored.popitem(last=False)
+
+#==============================================================================
+# Price store
+#==============================================================================
+
+class PriceStore(ParquetStore):
+    """
+    This class keeps the daily OHLCV bars of every ticker in a Parquet file,
+    with a JSON side file recording the date range already covered.
+
+    A request only fetches the bars missing before the covered range and,
+    at most every refresh_interval, the latest bars after it. Everything else
+    is served from memory or from disk.
+    """
+
+    def __init__(self, directory=CACHE_DIR / "prices", refresh_interval=REFRESH_INTERVAL,
+                 fetch=download_daily_bars, fetch_many=download_many_daily_bars,
+                 max_in_memory=MAX_TICKERS_IN_MEMORY):
+        super().__init__(directory, max_in_memory=max_in_memory)
+        self.refresh_interval = refresh_interval
+        self.fetch = fetch
+        self.fetch_many = fetch_many
+
+    def get_history(self, ticker, start=None, end=None):
+        """
+        This function returns the daily bars of a ticker between start
+        (inclusive, default EARLIEST_DATE) and end (exclusive, default
+        tomorrow), fetching only the part that is not stored yet.
+        """
+        start = EARLIEST_DATE if start is None else pd.Timestamp(start).normalize()
+        end = _tomorrow() if end is None else min(pd.Timestamp(end).normalize(), _tomorrow())
+
+        with self.ticker_lock(ticker):
+            data, meta = self.load(ticker)
+            data, meta = self._fill(ticker, data, meta, start, end)
+
+        return data.loc[(data.index >= start) & (data.index < end)].copy()
+
+    def get_histories(self, tickers, start=None, end=None):
+        """
+        This function returns a dictionary of the daily bars of several
+        tickers, like get_history. The tickers missing the same date ranges
+        are fetched together in one batched request per range.
+        """
+        start = EARLIEST_DATE if start is None else pd.Timestamp(start).normalize()
+        end = _tomorrow() if end is None else min(pd.Timestamp(end).normalize(), _tomorrow())
+        tickers = sorted(set(tickers))
+
+        stored = {}
+        for ticker in tickers:
+            with self.ticker_lock(ticker):
+                stored[ticker] = self.load(ticker)
+
+        groups = defaultdict(list)
+        for ticker, (data, meta) in stored.items():
+            gaps = tuple(self._gaps(data, meta, start, end))
+            if gaps:
+                groups[gaps].append(ticker)
+        for gaps, group in groups.items():
+            # Downloaded without the ticker locks, so a batch does not hold up the
+            # requests of a single ticker; each ticker is locked for its merge only,
+            # over the bars stored meanwhile
+            fetched = [self.fetch_many(group, *gap) for gap in gaps]
+            for ticker in group:
+                with self.ticker_lock(ticker):
+                    stored[ticker] = self._merge(ticker, *self.load(ticker), gaps,
+                                                 [frames[ticker] for frames in fetched])
+
+        return {ticker: data.loc[(data.index >= start) & (data.index < end)].copy()
+                for ticker, (data, _) in stored.items()}
+
+    def version(self, ticker):
+        """
+        This function returns a value that changes whenever new bars of the
+        ticker are stored (used to key caches built on top of the prices).
+        """
+        with self.ticker_lock(ticker):
+            _, meta = self.load(ticker)
+        return None if meta is None else meta['fetched_at']
+
+    def _fill(self, ticker, data, meta, start, end):
+        """
+        This function fetches the bars missing around the covered range and
+        saves the result.
+        """
+        gaps = self._gaps(data, meta, start, end)
+        if not gaps:
+            return data, meta
+        return self._merge(ticker, data, meta, gaps,
+                           [self.fetch(ticker, gap_start, gap_end) for gap_start, gap_end in gaps])
+
+    def _gaps(self, data, meta, start, end):
+        """
+        This function returns the (start, end) date ranges to fetch so that
+        the stored bars cover start to end and are not stale.
+        """
+        if meta is None:
+            return [(start, end)]
+        gaps = []
+        if start < meta['start']:
+            gaps.append((start, meta['start']))
+
+        # Refetch from the bar before the last stored one: the last one may
+        # still be moving and a change of the one before reveals a split or
+        # a dividend (see _merge)
+        last_bar = data.index[-1] if len(data) else meta['end']
+        check_bar = data.index[-2] if len(data) > 1 else last_bar
+        stale = datetime.now() - meta['fetched_at'] > self.refresh_interval
+        if stale and (end > meta['end'] or end > last_bar + pd.Timedelta(days=1) or last_bar >= _today()):
+            gaps.append((min(check_bar, meta['end']), end))
+        return gaps
+
+    def _merge(self, ticker, data, meta, gaps, fetched):
+        """
+        This function adds the fetched bars (one frame per gap) to the stored
+        ones and saves the result.
+
+        The provider returns an empty frame when a download fails, so the
+        covered range only grows over the gaps that returned bars (or, before
+        the first bar of a ticker, over the days it was not listed yet). When
+        the fetched bars revise the stored ones (a split or a dividend
+        adjusts the whole history), the full history is fetched again.
+        """
+        if meta is None:
+            data = fetched[0]
+            if data.empty:
+                # Failed download: nothing is recorded as covered
+                return data, None
+            meta = {'start': gaps[0][0], 'end': gaps[0][1]}
+        else:
+            meta = dict(meta)
+            frames = [data]
+            for (gap_start, gap_end), frame in zip(gaps, fetched):
+                if gap_end <= meta['start']:
+                    listed_later = len(data) and data.index[0] > meta['start'] + pd.Timedelta(days=7)
+                    if len(frame) or listed_later:
+                        meta['start'] = gap_start
+                        frames.append(frame)
+                elif len(frame):
+                    if _revised(data, frame):
+                        history = self.fetch(ticker, meta['start'], gap_end)
+                        if len(history):
+                            frames = [history]
+                    frames.append(frame)
+                    meta['end'] = max(meta['end'], gap_end)
+            data = pd.concat([frame for frame in frames if len(frame)] or [data])
+            data = data[~data.index.duplicated(keep='last')].sort_index()
+
+        meta['fetched_at'] = datetime.now()
+        self.save(ticker, data, meta)
+        return data, meta
+
+
+def _revised(stored, fetched):
+    """
+    This function tells if the fetched bars change the Close or Adj Close of
+    the stored bars they overlap, leaving out the last stored bar (it may
+    have been stored before the close).
+    """
+    return first_revision(stored, fetched) is not None
+
+
+def first_revision(stored, fetched, columns=('Close', 'Adj Close')):
+    """
+    This function returns the date of the first stored bar whose columns are
+    changed by the fetched bars they overlap (a split or a dividend revises
+    the history), leaving out the last stored bar like _revised, or None if
+    none of them is changed.
+    """
+    columns = list(columns)
+    common = stored.index[:-1].intersection(fetched.index)
+    same = np.isclose(stored.loc[common, columns].to_numpy(dtype=float),
+                      fetched.loc[common, columns].to_numpy(dtype=float),
+                      rtol=1e-5, equal_nan=True).all(axis=1)
+    return None if same.all() else common[~same][0]
+
+
+def temporary_path(path):
+    return path.with_name(path.name + '.tmp')
+
+
+def _today():
+    return pd.Timestamp.today().normalize()
+
+
+def _tomorrow():
+    return _today() + pd.Timedelta(days=1)
+
+# Store shared by all the sessions of the dashboard
+price_store = PriceStore()
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MEMORY-MAPPED RETURN MATRIX
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from constituents import constituents
+from price_store import CACHE_DIR, price_store, temporary_path
+
+# Matrices kept for every (date, ticker) pair, by file name
+MATRICES = ("closes", "returns")
+# Type of the values of the matrices
+DTYPE = np.float32
+# Number of days of history covered by the matrices
+HISTORY_DAYS = 5 * 365
+# Minimum time between two updates of the matrices, in seconds
+REFRESH_INTERVAL = 24 * 60 * 60
+# Number of tickers whose prices are downloaded in one batched request
+BATCH_SIZE = 50
+
+#==============================================================================
+# Columns
+#==============================================================================
+
+def price_columns(history, dates):
+    """
+    This function returns the adjusted closes and the log returns of a daily
+    history aligned on dates. The returns are computed on the own dates of
+    the ticker, so a missing day does not drop the return of the next one.
+    """
+    close = history['Adj Close'].dropna()
+    close = close.loc[close > 0]
+    returns = np.log(close).diff()
+    return (close.reindex(dates).to_numpy(dtype=DTYPE),
+            returns.reindex(dates).to_numpy(dtype=DTYPE))
+
+#==============================================================================
+# Return matrix
+#==============================================================================
+
+class ReturnMatrix:
+    """
+    This class keeps the adjusted closes and the daily log returns of many
+    tickers as two dates x tickers float32 matrices in raw files, read back
+    with np.memmap, plus a JSON index of their dates, tickers and the price
+    store version each column was written from.
+
+    The matrices are built incrementally, batch after batch: new dates are
+    appended as rows at the end of the files and only the columns of the
+    tickers with new bars are rewritten. Rows are contiguous, so a window of
+    dates is a view on the mapped file, without copy nor parsing.
+    """
+
+    def __init__(self, directory=CACHE_DIR / "matrix", history_days=HISTORY_DAYS,
+                 refresh_interval=REFRESH_INTERVAL, batch_size=BATCH_SIZE):
+        self.directory = directory
+        self.history_days = history_days
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self._job = None
+        self._lock = threading.Lock()
+
+    def get(self, matrix="returns", tickers=None, start=None):
+        """
+        This function returns one of the MATRICES as a DataFrame indexed by
+        date with a column per ticker, from start on. The frame wraps the
+        mapped file; selecting tickers copies their columns only.
+        """
+        with self._lock:
+            index = self._index()
+            if index is None:
+                return pd.DataFrame(dtype=DTYPE)
+            values = self._map(matrix, index, mode='r')
+        dates = pd.DatetimeIndex(index['dates'])
+        first = 0 if start is None else dates.searchsorted(pd.Timestamp(start))
+        frame = pd.DataFrame(values[first:], index=dates[first:], columns=index['tickers'],
+                             copy=False)
+        return frame if tickers is None else frame[list(tickers)]
+
+    def tickers(self):
+        """
+        This function returns the tickers held by the matrices.
+        """
+        with self._lock:
+            index = self._index()
+        return [] if index is None else index['tickers']
+
+    def get_returns(self, tickers, start):
+        """
+        This function returns the daily log returns of the tickers from start
+        on, from the matrix for the tickers it holds and from the price store
+        (in one batched request) for the others.
+        """
+        with self._lock:
+            index = self._index()
+        stored = [] if index is None else [ticker for ticker in tickers if ticker in index['tickers']]
+        missing = [ticker for ticker in tickers if ticker not in stored]
+        returns = self.get("returns", stored, start) if stored else pd.DataFrame(dtype=DTYPE)
+        if missing:
+            histories = price_store.get_histories(missing, start)
+            dates = pd.DatetimeIndex(returns.index)
+            for history in histories.values():
+                dates = dates.union(history.index)
+            returns = returns.reindex(dates)
+            for ticker in missing:
+                returns[ticker] = price_columns(histories[ticker], dates)[1]
+        return returns[list(tickers)]
+
+    def start(self):
+        """
+        This function starts the background job updating the matrices with
+        the S&P 500 constituents, unless it is running or ran recently.
+        """
+        with self._lock:
+            index = self._index()
+            if index is not None and time.time() - index['updated_at'] < self.refresh_interval:
+                return
+            if self._job is None or not self._job.is_alive():
+                self._job = threading.Thread(target=self.update, name="return_matrix", daemon=True)
+                self._job.start()
+
+    def running(self):
+        return self._job is not None and self._job.is_alive()
+
+    def update(self, tickers=None):
+        """
+        This function adds the daily bars of the tickers (default: the S&P 500
+        constituents) to the matrices, one batched price download at a time,
+        so the matrices fill in as the data arrives.
+        """
+        tickers = list(constituents.symbols() if tickers is None else tickers)
+        start = pd.Timestamp.today().normalize() - pd.Timedelta(days=self.history_days)
+        for first in range(0, len(tickers), self.batch_size):
+            batch = tickers[first:first + self.batch_size]
+            try:
+                histories = price_store.get_histories(batch, start)
+            except Exception:
+                continue  # Provider unavailable: try this batch on the next run
+            versions = {ticker: price_store.version(ticker) for ticker in batch}
+            with self._lock:
+                self._write(histories, versions)
+        with self._lock:
+            index = self._index()
+            if index is not None:
+                self._save_index(index)
+
+    def _path(self, name):
+        return self.directory / (name if name == "index.json" else f"{name}.f32")
+
+    def _index(self):
+        """
+        This function returns the index of the matrices (dates, tickers,
+        versions, updated_at), or None if they have never been written.
+        """
+        try:
+            with open(self._path("index.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _map(self, matrix, index, mode):
+        shape = (len(index['dates']), len(index['tickers']))
+        if 0 in shape:
+            return np.empty(shape, dtype=DTYPE)
+        return np.memmap(self._path(matrix), dtype=DTYPE, mode=mode, shape=shape)
+
+    def _write(self, histories, versions):
+        """
+        This function writes the columns of the tickers whose price store
+        version changed. Dates after the last row are appended in place; new
+        tickers or dates before the last row make the files be rewritten.
+        """
+        index = self._index() or {'dates': [], 'tickers': [], 'versions': {}, 'updated_at': 0}
+        changed = {ticker: history for ticker, history in histories.items()
+                   if ticker not in index['tickers']
+                   or index['versions'].get(ticker) != _isoformat(versions[ticker])}
+        if not changed:
+            return
+        dates = pd.DatetimeIndex(index['dates'])
+        new_dates = pd.DatetimeIndex(sorted(set().union(*[history.index for history in changed.values()])
+                                            - set(dates)))
+        new_tickers = [ticker for ticker in changed if ticker not in index['tickers']]
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if new_tickers or (len(new_dates) and len(dates) and new_dates[0] < dates[-1]):
+            self._reshape(index, dates.union(new_dates), index['tickers'] + new_tickers)
+        elif len(new_dates):
+            self._append(index, new_dates)
+
+        dates = pd.DatetimeIndex(index['dates'])
+        matrices = {matrix: self._map(matrix, index, mode='r+') for matrix in MATRICES}
+        for ticker, history in changed.items():
+            column = index['tickers'].index(ticker)
+            for matrix, values in zip(MATRICES, price_columns(history, dates)):
+                matrices[matrix][:, column] = values
+            index['versions'][ticker] = _isoformat(versions[ticker])
+        for values in matrices.values():
+            if isinstance(values, np.memmap):
+                values.flush()
+        # updated_at only moves once the whole update is done
+        self._save_index(index, updated=False)
+
+    def _append(self, index, new_dates):
+        """
+        This function grows the files by the rows of new_dates (filled with
+        NaN), keeping the rows already written in place.
+        """
+        rows, columns = len(index['dates']), len(index['tickers'])
+        index['dates'] = index['dates'] + [date.isoformat() for date in new_dates]
+        for matrix in MATRICES:
+            # Truncating first drops any row appended by an interrupted update
+            os.truncate(self._path(matrix), rows * columns * np.dtype(DTYPE).itemsize)
+            with open(self._path(matrix), 'ab') as f:
+                f.write(np.full((len(new_dates), columns), np.nan, dtype=DTYPE).tobytes())
+
+    def _reshape(self, index, dates, tickers):
+        """
+        This function rewrites the files with the given dates and tickers,
+        copying the values already written to their new positions.
+        """
+        old_dates = pd.DatetimeIndex(index['dates'])
+        rows = dates.get_indexer(old_dates)
+        columns = np.arange(len(index['tickers']))
+        for matrix in MATRICES:
+            values = np.full((len(dates), len(tickers)), np.nan, dtype=DTYPE)
+            if len(rows) and len(columns):
+                values[np.ix_(rows, columns)] = self._map(matrix, index, mode='r')
+            values.tofile(temporary_path(self._path(matrix)))
+            os.replace(temporary_path(self._path(matrix)), self._path(matrix))
+        index['dates'] = [date.isoformat() for date in dates]
+        index['tickers'] = list(tickers)
+
+    def _save_index(self, index, updated=True):
+        if updated:
+            index['updated_at'] = time.time()
+        with open(temporary_path(self._path("index.json")), 'w') as f:
+            json.dump(index, f)
+        os.replace(temporary_path(self._path("index.json")), self._path("index.json"))
+
+
+def _isoformat(version):
+    return None if version is None else version.isoformat()
+
+# Matrices shared by all the sessions of the dashboard
+return_matrix = ReturnMatrix()
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# S&P 500 SCREENER TABLE
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from constituents import constituents
+from info_cache import info_cache
+from price_store import CACHE_DIR, price_store
+
+# SQLite file holding the screener table
+DATABASE_PATH = CACHE_DIR / "screener.sqlite"
+# Company information fields stored for every constituent, by column name
+INFO_FIELDS = {"market_cap": "marketCap",
+               "beta": "beta",
+               "pe_ratio": "trailingPE",
+               "dividend_yield": "dividendYield",
+               "fifty_two_week_high": "fiftyTwoWeekHigh",
+               "fifty_two_week_low": "fiftyTwoWeekLow",
+               "average_volume": "averageVolume"}
+# Metrics computed from the daily prices, by column name
+METRIC_FIELDS = ["last_close", "return_1m", "return_1y", "volatility_1y"]
+# Minimum time between two updates of a constituent, in seconds
+REFRESH_INTERVAL = 24 * 60 * 60
+# Time before trying again a constituent whose data could not be fetched, in seconds
+RETRY_INTERVAL = 60 * 60
+# Number of tickers whose prices are downloaded in one batched request
+BATCH_SIZE = 50
+# Trading days per year, to annualize the volatility
+TRADING_DAYS = 252
+
+#==============================================================================
+# Rows
+#==============================================================================
+
+def price_metrics(history):
+    """
+    This function returns the last close, the 1-month and 1-year returns and
+    the annualized 1-year volatility of a daily history.
+    """
+    close = history['Adj Close'].dropna()
+    if len(close) < 2:
+        return {field: None for field in METRIC_FIELDS}
+    year = close.iloc[-TRADING_DAYS - 1:]
+    return {"last_close": float(close.iloc[-1]),
+            "return_1m": float(close.iloc[-1] / close.iloc[max(len(close) - 22, 0)] - 1),
+            "return_1y": float(year.iloc[-1] / year.iloc[0] - 1),
+            "volatility_1y": float(np.log(year).diff().std() * np.sqrt(TRADING_DAYS))}
+
+
+def info_fields(info):
+    """
+    This function returns the INFO_FIELDS of a company information
+    dictionary, None for the missing or non-numeric ones.
+    """
+    fields = {}
+    for column, key in INFO_FIELDS.items():
+        value = info.get(key)
+        fields[column] = float(value) if isinstance(value, (int, float)) else None
+    return fields
+
+#==============================================================================
+# Screener table
+#==============================================================================
+
+class Screener:
+    """
+    This class keeps a SQLite table with, for every S&P 500 constituent, its
+    sector, the INFO_FIELDS of its company information and the METRIC_FIELDS
+    computed from its daily prices.
+
+    The table is filled by a background job, batch after batch, so the
+    screener only reads a local table and never waits for the network.
+    """
+
+    def __init__(self, path=DATABASE_PATH, refresh_interval=REFRESH_INTERVAL,
+                 retry_interval=RETRY_INTERVAL, batch_size=BATCH_SIZE, max_workers=8):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self._failed = {}
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._job = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        """
+        This function opens the database (creating the table if needed) and
+        commits and closes it when the block ends.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                columns = ", ".join(f"{column} REAL" for column in list(INFO_FIELDS) + METRIC_FIELDS)
+                connection.execute(f"CREATE TABLE IF NOT EXISTS screener (symbol TEXT PRIMARY KEY, "
+                                   f"security TEXT, sector TEXT, sub_industry TEXT, {columns}, "
+                                   f"updated_at REAL)")
+                yield connection
+        finally:
+            connection.close()
+
+    def load(self):
+        """
+        This function returns the screener table as a DataFrame indexed by
+        symbol.
+        """
+        with self._connect() as connection:
+            return pd.read_sql("SELECT * FROM screener", connection, index_col="symbol")
+
+    def start(self):
+        """
+        This function starts the background job updating the constituents
+        older than the refresh interval, unless it is already running.
+        """
+        with self._lock:
+            if self._job is None or not self._job.is_alive():
+                self._job = threading.Thread(target=self.update, name="screener", daemon=True)
+                self._job.start()
+
+    def running(self):
+        return self._job is not None and self._job.is_alive()
+
+    def update(self):
+        """
+        This function updates the outdated constituents, one batch at a time:
+        one batched price download, concurrent company information requests
+        and one write of the batch rows.
+
+        Only the rows with both company information and prices are stamped
+        with updated_at; the others are written with what was fetched (over
+        the stored values, see _write) and tried again after the retry
+        interval.
+        """
+        table = constituents.get()
+        with self._connect() as connection:
+            updated = dict(connection.execute("SELECT symbol, updated_at FROM screener").fetchall())
+        now = time.time()
+        outdated = [row for row in table.itertuples(index=False)
+                    if now - (updated.get(row.Symbol) or 0) > self.refresh_interval
+                    and now - self._failed.get(row.Symbol, 0) > self.retry_interval]
+
+        start = pd.Timestamp.today().normalize() - pd.Timedelta(days=400)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for first in range(0, len(outdated), self.batch_size):
+                batch = outdated[first:first + self.batch_size]
+                symbols = [row.Symbol for row in batch]
+                try:
+                    histories = price_store.get_histories(symbols, start)
+                except Exception:
+                    continue  # Provider unavailable: try this batch on the next run
+                infos = executor.map(self._info, symbols)
+                rows = []
+                for row, info in zip(batch, infos):
+                    metrics = price_metrics(histories[row.Symbol])
+                    complete = bool(info) and metrics["last_close"] is not None
+                    if not complete:
+                        self._failed[row.Symbol] = time.time()
+                    rows.append({"symbol": row.Symbol, "security": row.Security,
+                                 "sector": row[2], "sub_industry": row[3] or None,
+                                 **info_fields(info), **metrics,
+                                 "updated_at": time.time() if complete else None})
+                self._write(rows)
+
+    def _info(self, symbol):
+        try:
+            return info_cache.get(symbol)
+        except Exception:
+            return {}
+
+    def _write(self, rows):
+        """
+        This function upserts the rows, keeping the stored value of every
+        field that could not be fetched this time.
+        """
+        if not rows:
+            return
+        columns = list(rows[0])
+        updates = ", ".join(f"{column} = COALESCE(excluded.{column}, {column})"
+                            for column in columns if column != "symbol")
+        with self._connect() as connection:
+            connection.executemany(
+                f"INSERT INTO screener ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT(symbol) DO UPDATE SET {updates}",
+                [tuple(row[column] for column in columns) for row in rows])
+
+# Screener shared by all the sessions of the dashboard
+screener = Screener()
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# INCREMENTAL MONTE CARLO SIMULATION STORE
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import threading
+from collections import OrderedDict
+import numpy as np
+from montecarlo import draw_shocks
+
+# Number of paths that share one random generator; matches the slider step
+BLOCK_SIZE = 100
+# Default limits of the store before the least recently used runs are evicted
+DEFAULT_MAX_ENTRIES = 8
+DEFAULT_MAX_BYTES = 512 * 2**20
+# Variance reduction methods whose paths can be continued to a longer horizon
+EXTENDABLE_METHODS = ("plain", "antithetic", "moment_matching")
+
+#==============================================================================
+# Simulation store
+#==============================================================================
+
+class _SimulationEntry:
+    """
+    This class holds the paths simulated so far for one store key, with one
+    random generator and one model state per block of BLOCK_SIZE paths so
+    that every block can be continued from its last state, and the
+    cumulative log return of every path.
+    """
+
+    def __init__(self, last_price, dtype):
+        self.last_price = last_price
+        self.paths = np.full((1, 0), last_price, dtype=dtype)
+        self.cumulative = np.zeros(0, dtype=dtype)
+        self.generators = []
+        self.states = []
+
+    @property
+    def nbytes(self):
+        return self.paths.nbytes
+
+
+class SimulationStore:
+    """
+    This class memoizes Monte Carlo paths keyed on (ticker, model, seed,
+    variance reduction method), with least recently used eviction. The model
+    part of the key holds the fitted parameters (mu and sigma for GBM).
+
+    Asking for more paths only simulates the missing blocks, and asking for a
+    longer horizon continues the existing paths from their last price, model
+    state and generator instead of regenerating them. The models draw their
+    random numbers day by day, so the continued paths are the ones a single
+    run over the longer horizon gives; Sobol points depend on the horizon
+    (one dimension per day), so for them a longer horizon regenerates the
+    entry. Shorter requests are served as views of the stored paths.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 block_size=BLOCK_SIZE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._entries = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_paths(self, ticker, model, seed, method, last_price, time_horizon,
+                  num_simulations, dtype=np.float64):
+        """
+        This function returns a (paths, new_steps) tuple. paths is a read-only
+        (time_horizon + 1, num_simulations) view and new_steps is the number
+        of path-days that had to be simulated for this call.
+        """
+        dtype = np.dtype(dtype)
+        key = (ticker, model.key, int(seed), method, dtype.str)
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or entry.last_price != last_price:
+                    entry = _SimulationEntry(last_price, dtype)
+                    self._entries[key] = entry
+                self._entries.move_to_end(key)
+
+            # Only the runs of the same key wait for each other while simulating
+            new_steps = self._extend(entry, model, seed, method, time_horizon, num_simulations)
+            with self._lock:
+                self._evict()
+
+            paths = entry.paths[:time_horizon + 1, :num_simulations]
+            paths.flags.writeable = False
+            return paths, new_steps
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _extend(self, entry, model, seed, method, time_horizon, num_simulations):
+        """
+        This function grows an entry in place to cover the requested horizon
+        and number of paths, and returns the number of simulated path-days.
+        """
+        new_steps = 0
+        horizon = entry.paths.shape[0] - 1
+        dtype = entry.paths.dtype
+        if time_horizon > horizon and method not in EXTENDABLE_METHODS:
+            entry.generators, entry.states = [], []
+            entry.cumulative = entry.cumulative[:0]
+
+        # Continue the existing blocks from their last state
+        if time_horizon > horizon and entry.generators:
+            extension = np.empty((time_horizon - horizon, entry.paths.shape[1]), dtype=dtype)
+            entry.states = self._simulate(model, entry.generators, entry.states, method,
+                                          entry.last_price, entry.cumulative, extension)
+            entry.paths = np.concatenate([entry.paths, extension])
+            new_steps += extension.size
+        if time_horizon > horizon:
+            horizon = time_horizon
+            if not entry.generators:
+                entry.paths = np.full((horizon + 1, 0), entry.last_price, dtype=dtype)
+
+        # Add whole blocks of new paths, each block with its own generator
+        num_blocks = -(-num_simulations // self.block_size)
+        if num_blocks > len(entry.generators):
+            generators = [np.random.default_rng(np.random.SeedSequence(int(seed), spawn_key=(b,)))
+                          for b in range(len(entry.generators), num_blocks)]
+            blocks = np.empty((horizon + 1, len(generators) * self.block_size), dtype=dtype)
+            blocks[0] = entry.last_price
+            cumulative = np.zeros(blocks.shape[1], dtype=dtype)
+            states = self._simulate(model, generators, [None] * len(generators), method,
+                                    entry.last_price, cumulative, blocks[1:])
+            entry.paths = np.concatenate([entry.paths, blocks], axis=1)
+            entry.cumulative = np.concatenate([entry.cumulative, cumulative])
+            entry.generators += generators
+            entry.states += states
+            new_steps += blocks[1:].size
+
+        return new_steps
+
+    def _simulate(self, model, generators, states, method, last_price, cumulative, out):
+        """
+        This function fills out with the next days of the prices of the blocks
+        of the generators, continued from their states and from cumulative
+        (updated in place), and returns their new states.
+
+        Each block draws from its own generator. A model with a recursion over
+        the days (GARCH) runs it once over all the blocks, the others simulate
+        one block at a time.
+        """
+        days, dtype = out.shape[0], out.dtype
+        returns_from_shocks = getattr(model, "returns_from_shocks", None)
+        if returns_from_shocks is not None:
+            shocks = np.concatenate([draw_shocks(generator, days, self.block_size, method, dtype)
+                                     for generator in generators], axis=1)
+            log_returns, state = returns_from_shocks(
+                shocks, None if states[0] is None else np.concatenate(states))
+            out[:], cumulative[:] = _continue_paths(last_price, log_returns, cumulative)
+            return np.split(state, len(generators))
+        new_states = []
+        for b, (generator, state) in enumerate(zip(generators, states)):
+            cols = slice(b * self.block_size, (b + 1) * self.block_size)
+            log_returns, state = model.log_returns(generator, days, self.block_size, method, dtype, state)
+            out[:, cols], cumulative[cols] = _continue_paths(last_price, log_returns, cumulative[cols])
+            new_states.append(state)
+        return new_states
+
+    def _evict(self):
+        """
+        This function drops the least recently used entries until the store
+        is within its limits (the most recent entry is always kept).
+        """
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or
+                sum(entry.nbytes for entry in self._entries.values()) > self.max_bytes):
+            key, _ = self._entries.popitem(last=False)
+            self._locks.pop(key, None)
+
+
+def _continue_paths(last_price, log_returns, start):
+    """
+    This function returns the prices of the paths of a (days, paths) array of
+    log returns continuing from the cumulative log returns start, and their
+    new cumulative log returns. The sums run in the same order as in
+    paths_from_log_returns, so continued paths are bit-identical to paths
+    simulated over the longer horizon at once.
+    """
+    cumulative = np.cumsum(np.concatenate([start[None], log_returns]), axis=0)[1:]
+    last = cumulative[-1].copy()
+    np.exp(cumulative, out=cumulative)
+    cumulative *= np.asarray(last_price, dtype=log_returns.dtype)
+    return cumulative, last
+
+# Store shared by all the sessions of the dashboard
+simulation_store = SimulationStore()
+
+###############################################################################
+# END
+###############################################################################
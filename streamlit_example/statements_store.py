@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# LOCAL FINANCIAL STATEMENTS STORE
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+from datetime import datetime, timedelta
+import pandas as pd
+import yfinance as yf
+from price_store import CACHE_DIR, MAX_TICKERS_IN_MEMORY, ParquetStore
+
+# yf.Ticker attribute holding each financial statement and period
+STATEMENTS = {("Income Statement", "Annual"): "financials",
+              ("Income Statement", "Quarterly"): "quarterly_financials",
+              ("Balance Sheet", "Annual"): "balance_sheet",
+              ("Balance Sheet", "Quarterly"): "quarterly_balance_sheet",
+              ("Cash Flow", "Annual"): "cashflow",
+              ("Cash Flow", "Quarterly"): "quarterly_cashflow"}
+
+# Time left to the company to publish its statements after the earnings date
+EARNINGS_LAG = timedelta(days=2)
+# After an earnings date, the statements are checked daily during this window
+EARNINGS_WINDOW = timedelta(days=30)
+# Time between two checks when no earnings date is known or it is long past
+MAX_AGE = timedelta(days=30)
+# Time before trying again when the provider returned no statements
+RETRY_INTERVAL = timedelta(hours=1)
+
+#==============================================================================
+# Provider
+#==============================================================================
+
+def next_earnings_date(stock_info):
+    """
+    This function returns the next (or else the latest) earnings date in
+    the calendar of a yf.Ticker, or None if it is not available.
+    """
+    try:
+        dates = stock_info.calendar.get("Earnings Date") or []
+        dates = sorted(pd.Timestamp(date) for date in dates)
+    except Exception:
+        return None
+    if not dates:
+        return None
+    upcoming = [date for date in dates if date >= pd.Timestamp.today().normalize()]
+    return (upcoming[0] if upcoming else dates[-1]).to_pydatetime()
+
+
+def download_statements(ticker):
+    """
+    This function downloads the six financial statements of a ticker in one
+    batch, with the earnings date used to invalidate them.
+    """
+    stock_info = yf.Ticker(ticker)
+    statements = {name: getattr(stock_info, name) for name in STATEMENTS.values()}
+    return statements, next_earnings_date(stock_info)
+
+
+def expiry(fetched_at, earnings_date):
+    """
+    This function returns when statements fetched at fetched_at must be
+    fetched again: shortly after the next earnings date, daily in the weeks
+    following an earnings date, else after MAX_AGE.
+    """
+    if earnings_date is not None:
+        if earnings_date > fetched_at:
+            return earnings_date + EARNINGS_LAG
+        if fetched_at - earnings_date < EARNINGS_WINDOW:
+            return fetched_at + timedelta(days=1)
+    return fetched_at + MAX_AGE
+
+#==============================================================================
+# Statements store
+#==============================================================================
+
+class StatementsStore(ParquetStore):
+    """
+    This class keeps the six financial statements of every ticker in Parquet
+    files, with a JSON side file recording when they expire.
+
+    Statements only change when a company reports, so they are fetched again
+    only around its earnings dates; switching between statements and periods
+    is served from memory.
+    """
+
+    def __init__(self, directory=CACHE_DIR / "statements", fetch=download_statements,
+                 max_in_memory=MAX_TICKERS_IN_MEMORY):
+        super().__init__(directory, frame_names=list(STATEMENTS.values()), max_in_memory=max_in_memory)
+        self.fetch = fetch
+
+    def get_all(self, ticker):
+        """
+        This function returns a dictionary of the six statements of a ticker,
+        keyed by their yf.Ticker attribute name.
+        """
+        with self.ticker_lock(ticker):
+            statements, meta = self.load(ticker)
+            if statements is None or datetime.now() >= meta['expires_at']:
+                try:
+                    fetched, earnings_date = self.fetch(ticker)
+                except Exception:
+                    if statements is None:
+                        raise
+                    fetched = None
+                fetched_at = datetime.now()
+                if fetched is None or all(frame.empty for frame in fetched.values()):
+                    # Provider unavailable (yfinance returns empty frames on errors):
+                    # serve the stored ones, if any, and try again soon
+                    if statements is None:
+                        statements, meta = fetched, {'fetched_at': fetched_at, 'earnings_date': None}
+                    meta = dict(meta, expires_at=fetched_at + RETRY_INTERVAL)
+                else:
+                    statements = fetched
+                    meta = {'fetched_at': fetched_at, 'earnings_date': earnings_date,
+                            'expires_at': expiry(fetched_at, earnings_date)}
+                self.save(ticker, statements, meta)
+        return statements
+
+    def _paths(self, ticker):
+        folder = self.directory / ticker
+        return {name: folder / f"{name}.parquet" for name in self.frame_names}, \
+            folder / "meta.json"
+
+    def _read_frame(self, path):
+        frame = pd.read_parquet(path)
+        frame.columns = pd.to_datetime(frame.columns)
+        return frame
+
+    def _write_frame(self, frame, path):
+        # Parquet only takes text column names, the period end dates are restored on load
+        frame = frame.copy()
+        frame.columns = [str(column) for column in frame.columns]
+        frame.to_parquet(path)
+
+# Store shared by all the sessions of the dashboard
+statements_store = StatementsStore()
+
+###############################################################################
+# END
+###############################################################################
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# SHARED YAHOO FINANCE SESSION
+# Ref: https://github.com/ranaroussi/yfinance/issues/1729
+###############################################################################
+
+#==============================================================================
+# Initiating
+#==============================================================================
+
+# Libraries
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# How long a cookie and crumb pair is reused before authenticating again
+CRUMB_TTL = 60 * 60
+# Number of keep-alive connections kept open per Yahoo host
+POOL_SIZE = 10
+
+#==============================================================================
+# Yahoo session
+#==============================================================================
+
+class YahooSession:
+    """
+    This class shares one HTTP session (keep-alive connection pool and cookie
+    jar) and one Yahoo cookie/crumb pair between all the callers and threads.
+
+    The crumb is cached for crumb_ttl seconds and only refreshed earlier when
+    Yahoo rejects it (HTTP 401 or "Invalid Crumb"), so a request normally
+    costs a single round trip.
+    """
+    user_agent_key = "User-Agent"
+    user_agent_value = ("Mozilla/5.0 (Windows NT 6.1; Win64; x64) "
+                        "AppleWebKit/537.36 (KHTML, like Gecko) "
+                        "Chrome/58.0.3029.110 Safari/537.36")
+
+    def __init__(self, crumb_ttl=CRUMB_TTL, pool_size=POOL_SIZE):
+        self.crumb_ttl = crumb_ttl
+        self.session = requests.Session()
+        self.session.headers[self.user_agent_key] = self.user_agent_value
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self._crumb = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def _authenticate(self):
+        """
+        This function gets a new auth cookie (stored in the session cookie
+        jar) and the crumb that goes with it.
+        """
+        response = self.session.get("https://fc.yahoo.com", allow_redirects=True)
+        if not response.cookies:
+            raise Exception("Failed to obtain Yahoo auth cookie.")
+
+        crumb_response = self.session.get(
+            "https://query1.finance.yahoo.com/v1/test/getcrumb",
+            allow_redirects=True,
+        )
+        crumb = crumb_response.text
+        if not crumb or crumb_response.status_code != 200:
+            raise Exception("Failed to retrieve Yahoo crumb.")
+
+        return crumb
+
+    def crumb(self, rejected=None):
+        """
+        This function returns the cached crumb, authenticating again if it
+        has expired or if it is the rejected one. Concurrent callers wait for
+        a single authentication.
+        """
+        with self._lock:
+            if self._crumb is None or time.monotonic() > self._expires or self._crumb == rejected:
+                self._crumb = self._authenticate()
+                self._expires = time.monotonic() + self.crumb_ttl
+            return self._crumb
+
+    def get(self, url, params=None):
+        """
+        This function sends a GET request with the crumb and returns the
+        response, re-authenticating once if Yahoo rejects the crumb.
+        """
+        params = dict(params or {})
+        crumb = self.crumb()
+        response = self.session.get(url, params={**params, "crumb": crumb}, allow_redirects=True)
+        if response.status_code == 401 or \
+                (response.status_code != 200 and "Invalid Crumb" in response.text):
+            crumb = self.crumb(rejected=crumb)
+            response = self.session.get(url, params={**params, "crumb": crumb}, allow_redirects=True)
+        return response
+
+# Session shared by all the users of the dashboard
+yahoo_session = YahooSession()
+
+###############################################################################
+# END
+###############################################################################